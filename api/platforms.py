@@ -1,10 +1,11 @@
 # Platform build and download endpoints
 
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Request, Response
 from fastapi.responses import FileResponse, PlainTextResponse
 
 from core.style_dictionary import style_builder
+from core.build_jobs import build_jobs
 from core.config import settings
 
 router = APIRouter()
@@ -28,12 +29,42 @@ async def get_available_platforms():
         "build_status": status["build_cache"]
     }
 
+def _summarize_build(results: dict) -> dict:
+    """Summarize per-platform build results"""
+    successful = [r for r in results.values() if r["success"]]
+    failed = [r for r in results.values() if not r["success"]]
+    total_files = sum(len(r["output_files"]) for r in successful)
+    
+    return {
+        "success": len(failed) == 0,
+        "built_platforms": len(successful),
+        "failed_platforms": len(failed),
+        "total_output_files": total_files,
+        "cached_platforms": [r["platform"] for r in successful if r.get("cached")],
+        "skipped_platforms": [r["platform"] for r in successful if r.get("skipped")],
+        "build_results": results,
+        "summary": {
+            "successful": [r["platform"] for r in successful],
+            "failed": [r["platform"] for r in failed]
+        }
+    }
+
+def _job_response(job) -> dict:
+    """Describe a build job, with its results once finished"""
+    response = job.to_dict()
+    if job.results is not None:
+        response.update(_summarize_build(job.results))
+    return response
+
 @router.post("/build")
 async def build_all_platforms(
+    response: Response,
     platforms: Optional[List[str]] = None,
-    background_tasks: BackgroundTasks = None
+    background_tasks: BackgroundTasks = None,
+    force_rebuild: bool = Query(False, description="Rebuild even if a cached build matches"),
+    wait: bool = Query(False, description="Hold the request until the build job finishes")
 ):
-    """Build tokens for all or specified platforms"""
+    """Build tokens for all or specified platforms (202 with a job to poll at /build/jobs/{job_id})"""
     if platforms is None:
         platforms = settings.PLATFORMS
     
@@ -47,25 +78,23 @@ async def build_all_platforms(
         )
     
     try:
-        results = await style_builder.build_platforms(platforms)
+        job, _ = await build_jobs.submit(platforms, force_rebuild=force_rebuild)
+        
+        if not wait:
+            response.status_code = 202
+            return _job_response(job)
         
-        # Calculate summary
-        successful = [r for r in results.values() if r["success"]]
-        failed = [r for r in results.values() if not r["success"]]
-        total_files = sum(len(r["output_files"]) for r in successful)
+        await build_jobs.wait(job)
+        if job.results is None:
+            raise HTTPException(status_code=500, detail=f"Build failed: {job.error}")
         
         return {
-            "success": len(failed) == 0,
-            "built_platforms": len(successful),
-            "failed_platforms": len(failed),
-            "total_output_files": total_files,
-            "build_results": results,
-            "summary": {
-                "successful": [r["platform"] for r in successful],
-                "failed": [r["platform"] for r in failed]
-            }
+            **_job_response(job),
+            "build_duration_ms": job.duration_ms
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -73,8 +102,13 @@ async def build_all_platforms(
         )
 
 @router.post("/build/{platform}")
-async def build_single_platform(platform: str):
-    """Build tokens for a specific platform"""
+async def build_single_platform(
+    platform: str,
+    response: Response,
+    force_rebuild: bool = Query(False, description="Rebuild even if a cached build matches"),
+    wait: bool = Query(False, description="Hold the request until the build job finishes")
+):
+    """Build tokens for a specific platform (as a job; see POST /build)"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
         raise HTTPException(
@@ -83,22 +117,33 @@ async def build_single_platform(platform: str):
         )
     
     try:
-        results = await style_builder.build_platforms([platform])
-        result = results[platform]
+        job, _ = await build_jobs.submit([platform], force_rebuild=force_rebuild)
+        
+        if not wait:
+            response.status_code = 202
+            return _job_response(job)
         
-        if not result["success"]:
+        await build_jobs.wait(job)
+        result = (job.results or {}).get(platform)
+        
+        if result is None or not result["success"]:
+            error = result.get('error', 'Unknown error') if result else job.error
             raise HTTPException(
                 status_code=500,
-                detail=f"Build failed: {result.get('error', 'Unknown error')}"
+                detail=f"Build failed: {error}"
             )
         
         return {
             "success": True,
+            "job_id": job.id,
             "platform": platform,
             "build_time": result["build_time"],
             "output_files": result["output_files"],
             "file_count": len(result["output_files"]),
             "build_duration_ms": result["build_duration_ms"],
+            "cached": result.get("cached", False),
+            "skipped": result.get("skipped", False),
+            "skipped_files": result.get("skipped_files", []),
             "total_size_bytes": sum(result["file_sizes"].values())
         }
         
@@ -110,8 +155,31 @@ async def build_single_platform(platform: str):
             detail=f"Build failed: {str(e)}"
         )
 
+@router.get("/jobs")
+async def list_build_jobs():
+    """List recent build jobs, newest first"""
+    return {
+        "jobs": [job.to_dict() for job in build_jobs.list_jobs()],
+        "queue": build_jobs.get_status()
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_build_job(job_id: str):
+    """Get the status of a build job, with its results once finished"""
+    job = build_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Build job '{job_id}' not found"
+        )
+    
+    return _job_response(job)
+
 @router.get("/{platform}")
-async def get_platform_info(platform: str):
+async def get_platform_info(
+    platform: str,
+    version: Optional[str] = Query(None, description="Build version to read; defaults to the published one")
+):
     """Get information about a specific platform"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
@@ -120,18 +188,48 @@ async def get_platform_info(platform: str):
             detail=f"Invalid platform '{platform}'. Available: {available}"
         )
     
-    files = style_builder.get_platform_files(platform)
+    manifest = style_builder.get_platform_manifest(platform, version)
+    
+    if manifest is None:
+        return {
+            "platform": platform,
+            "version": version,
+            "files": [],
+            "file_count": 0,
+            "total_size_bytes": 0,
+            "last_modified": None
+        }
     
     return {
         "platform": platform,
-        "files": files,
-        "file_count": len(files),
-        "total_size_bytes": sum(f["size"] for f in files),
-        "last_modified": max((f["modified"] for f in files), default=None)
+        "version": manifest["version"],
+        "files": manifest["files"],
+        "file_count": manifest["file_count"],
+        "total_size_bytes": manifest["total_size_bytes"],
+        "last_modified": manifest["last_modified"]
+    }
+
+@router.get("/{platform}/versions")
+async def list_platform_versions(platform: str):
+    """List the retained build versions of a platform, most recently used first"""
+    available = settings.PLATFORMS + ['scss', 'json']
+    if platform not in available:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid platform '{platform}'. Available: {available}"
+        )
+    
+    return {
+        "platform": platform,
+        "current_version": style_builder.artifacts.current_key(platform),
+        "versions": style_builder.get_platform_versions(platform)
     }
 
 @router.get("/{platform}/files")
-async def list_platform_files(platform: str):
+async def list_platform_files(
+    platform: str,
+    version: Optional[str] = Query(None, description="Build version to read; defaults to the published one")
+):
     """List all files for a platform"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
@@ -140,9 +238,9 @@ async def list_platform_files(platform: str):
             detail=f"Invalid platform '{platform}'. Available: {available}"
         )
     
-    files = style_builder.get_platform_files(platform)
+    manifest = style_builder.get_platform_manifest(platform, version)
     
-    if not files:
+    if not manifest or not manifest["files"]:
         raise HTTPException(
             status_code=404,
             detail=f"No files found for platform '{platform}'. Run build first."
@@ -150,11 +248,24 @@ async def list_platform_files(platform: str):
     
     return {
         "platform": platform,
-        "files": files
+        "version": manifest["version"],
+        "files": manifest["files"]
     }
 
+def _encoding_headers(encoding: Optional[str], entry: dict) -> dict:
+    """Headers for a download that may be served from a precompressed variant"""
+    # Artifacts are immutable per version, so their content hash is a strong validator
+    headers = {"Vary": "Accept-Encoding", "ETag": f'"{entry["sha256"]}-{encoding or "identity"}"'}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return headers
+
 @router.get("/{platform}/download")
-async def download_platform_bundle(platform: str):
+async def download_platform_bundle(
+    platform: str,
+    request: Request,
+    version: Optional[str] = Query(None, description="Build version to read; defaults to the published one")
+):
     """Download main file for a platform"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
@@ -174,35 +285,31 @@ async def download_platform_bundle(platform: str):
     }
     
     main_file = main_files.get(platform, "tokens.json")
-    file_path = settings.BUILD_DIR / platform / main_file
     
-    if not file_path.exists():
+    try:
+        file_path, encoding, entry = style_builder.get_encoded_artifact(
+            platform, main_file, version, request.headers.get("accept-encoding")
+        )
+    except FileNotFoundError:
         raise HTTPException(
             status_code=404,
             detail=f"Main file not found for platform '{platform}'. Run build first."
         )
     
-    # Determine media type
-    media_types = {
-        ".css": "text/css",
-        ".scss": "text/scss",
-        ".swift": "text/x-swift",
-        ".xml": "application/xml",
-        ".dart": "text/x-dart",
-        ".json": "application/json",
-        ".js": "text/javascript"
-    }
-    
-    media_type = media_types.get(file_path.suffix, "text/plain")
-    
     return FileResponse(
         path=file_path,
         filename=main_file,
-        media_type=media_type
+        media_type=entry["media_type"],
+        headers=_encoding_headers(encoding, entry)
     )
 
 @router.get("/{platform}/files/{filename}")
-async def download_platform_file(platform: str, filename: str):
+async def download_platform_file(
+    platform: str,
+    filename: str,
+    request: Request,
+    version: Optional[str] = Query(None, description="Build version to read; defaults to the published one")
+):
     """Download a specific file from a platform"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
@@ -211,30 +318,29 @@ async def download_platform_file(platform: str, filename: str):
             detail=f"Invalid platform '{platform}'. Available: {available}"
         )
     
-    file_path = settings.BUILD_DIR / platform / filename
-    
-    if not file_path.exists():
+    try:
+        file_path, encoding, entry = style_builder.get_encoded_artifact(
+            platform, filename, version, request.headers.get("accept-encoding")
+        )
+    except FileNotFoundError:
         raise HTTPException(
             status_code=404,
             detail=f"File '{filename}' not found for platform '{platform}'"
         )
     
-    # Security check - ensure file is within platform directory
-    try:
-        file_path.resolve().relative_to(settings.BUILD_DIR / platform)
-    except ValueError:
-        raise HTTPException(
-            status_code=403,
-            detail="Access denied"
-        )
-    
     return FileResponse(
         path=file_path,
-        filename=filename
+        filename=filename,
+        media_type=entry["media_type"],
+        headers=_encoding_headers(encoding, entry)
     )
 
 @router.get("/{platform}/files/{filename}/content")
-async def get_file_content(platform: str, filename: str):
+async def get_file_content(
+    platform: str,
+    filename: str,
+    version: Optional[str] = Query(None, description="Build version to read; defaults to the published one")
+):
     """Get the text content of a specific file"""
     available = settings.PLATFORMS + ['scss', 'json']
     if platform not in available:
@@ -244,7 +350,7 @@ async def get_file_content(platform: str, filename: str):
         )
     
     try:
-        content = style_builder.get_file_content(platform, filename)
+        content = style_builder.get_file_content(platform, filename, version)
         
         return PlainTextResponse(
             content=content,
@@ -269,15 +375,11 @@ async def clear_platform_build(platform: str):
         )
     
     try:
-        platform_dir = settings.BUILD_DIR / platform
-        if platform_dir.exists():
-            import shutil
-            shutil.rmtree(platform_dir)
-            platform_dir.mkdir(exist_ok=True)
+        style_builder.clear_platform_build(platform)
         
         return {
             "success": True,
-            "message": f"Build files cleared for platform '{platform}'"
+            "message": f"Build unpublished for platform '{platform}'"
         }
         
     except Exception as e:
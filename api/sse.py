@@ -2,11 +2,12 @@ import json
 import asyncio
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Request, Query
+from fastapi import APIRouter, Header, Request, Query
 from sse_starlette import EventSourceResponse
 
 from core.update_broadcaster import broadcaster
 from core.token_manager import token_manager
+from core.config import settings
 
 router = APIRouter()
 
@@ -14,7 +15,9 @@ router = APIRouter()
 async def stream_token_updates(
     request: Request,
     since_version: Optional[int] = Query(None, description="Get updates since this version"),
-    client_hash: Optional[str] = Query(None, description="Client's current token hash")
+    client_hash: Optional[str] = Query(None, description="Client's current token hash"),
+    last_event_id: Optional[str] = Header(None, description="Sent by EventSource on reconnect"),
+    compact: bool = Query(True, description="Send missed updates as one net delta; false sends every update")
 ):
     """
     Server-Sent Events endpoint for real-time token updates.
@@ -22,10 +25,27 @@ async def stream_token_updates(
     More reliable than WebSockets for design token updates.
     Automatically handles reconnection and missed updates.
     """
+    # Token updates carry their version as the event id, so a reconnecting
+    # EventSource resumes from where it left off
+    if since_version is None and last_event_id and last_event_id.isdigit():
+        since_version = int(last_event_id)
+    
+    def resync_required(message: str) -> dict:
+        return {
+            "event": "resync-required",
+            "data": json.dumps({
+                "type": "RESYNC_REQUIRED",
+                "version": broadcaster.current_version,
+                "hash": broadcaster.current_hash,
+                "message": f"{message}; reload the tokens",
+                "timestamp": datetime.now().isoformat()
+            })
+        }
     
     async def event_generator():
-        # Add this client to SSE connections
-        broadcaster.add_sse_connection(request)
+        # Subscribe before catching up so nothing broadcast meanwhile is lost
+        queue = broadcaster.subscribe()
+        sent_version = since_version or 0
         
         try:
             # Send initial connection confirmation
@@ -42,13 +62,21 @@ async def stream_token_updates(
             
             # If client provided version, send missed updates
             if since_version is not None:
-                missed_updates = broadcaster.get_updates_since_version(since_version)
-                if missed_updates:
+                if compact:
+                    missed_updates = broadcaster.get_net_delta_since_version(since_version)
+                else:
+                    missed_updates = broadcaster.get_updates_since_version(since_version)
+                if missed_updates is None:
+                    yield resync_required("Version is older than the update history")
+                elif missed_updates:
+                    sent_version = missed_updates[-1]["version"]
                     yield {
+                        "id": str(sent_version),
                         "event": "missed-updates",
                         "data": json.dumps({
                             "type": "MISSED_UPDATES",
                             "count": len(missed_updates),
+                            "compacted": compact,
                             "updates": missed_updates
                         })
                     }
@@ -58,12 +86,16 @@ async def stream_token_updates(
             # If client provided hash and it doesn't match, send recent updates
             elif client_hash and client_hash != broadcaster.current_hash:
                 recent_updates = broadcaster.get_updates_since_hash(client_hash)
-                if recent_updates:
+                if recent_updates is None:
+                    yield resync_required("Unknown token hash")
+                elif recent_updates:
+                    sent_version = recent_updates[-1]["version"]
                     yield {
+                        "id": str(sent_version),
                         "event": "sync-required",
                         "data": json.dumps({
                             "type": "SYNC_REQUIRED",
-                            "message": "Client hash mismatch, syncing recent updates",
+                            "message": "Client hash mismatch, syncing missed updates",
                             "updates": recent_updates
                         })
                     }
@@ -77,37 +109,27 @@ async def stream_token_updates(
                 })
             }
             
-            # Keep connection alive and send updates
-            last_heartbeat = asyncio.get_event_loop().time()
-            
+            # Wait for pushed updates; sse-starlette cancels this generator on disconnect
             while True:
-                if await request.is_disconnected():
-                    break
-                
-                # Check for new updates
-                latest_update = broadcaster.get_latest_update()
-                if latest_update:
-                    yield {
-                        "event": "token-update",
-                        "data": json.dumps(latest_update)
-                    }
-                    broadcaster.clear_latest_update()
-                
-                # Send periodic heartbeat (every 30 seconds)
-                current_time = asyncio.get_event_loop().time()
-                if current_time - last_heartbeat > 30:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
                     yield {
                         "event": "heartbeat",
                         "data": json.dumps({
                             "type": "HEARTBEAT",
-                            "timestamp": current_time,
-                            "client_count": len(broadcaster.sse_connections)
+                            "timestamp": asyncio.get_event_loop().time(),
+                            "client_count": len(broadcaster.subscribers)
                         })
                     }
-                    last_heartbeat = current_time
+                    continue
                 
-                # Short sleep to prevent busy waiting
-                await asyncio.sleep(1)
+                # Already delivered with the missed updates
+                if event.type == "TOKEN_UPDATE" and event.version <= sent_version:
+                    continue
+                
+                # Encoded once by the broadcaster and shared by every client
+                yield event.frame
                 
         except asyncio.CancelledError:
             # Client disconnected gracefully
@@ -126,7 +148,7 @@ async def stream_token_updates(
                 pass  # Connection likely closed
         finally:
             # Clean up connection
-            broadcaster.remove_sse_connection(request)
+            broadcaster.unsubscribe(queue)
     
     return EventSourceResponse(event_generator())
 
@@ -134,21 +156,29 @@ async def stream_token_updates(
 async def get_sse_status():
     """Get SSE connection and update status"""
     return {
-        "sse_clients": len(broadcaster.sse_connections),
+        "sse_clients": len(broadcaster.subscribers),
         "current_status": broadcaster.get_current_status(),
-        "token_metadata": token_manager.get_token_metadata()
+        "token_metadata": token_manager.get_token_metadata(),
+        "token_writes": token_manager.get_write_stats()
     }
 
 @router.get("/updates/since/{version}")
-async def get_updates_since_version(version: int):
+async def get_updates_since_version(
+    version: int,
+    compact: bool = Query(True, description="Fold the updates into one net delta; false returns every update")
+):
     """Get all updates since a specific version (HTTP fallback for polling)"""
-    updates = broadcaster.get_updates_since_version(version)
+    if compact:
+        updates = broadcaster.get_net_delta_since_version(version)
+    else:
+        updates = broadcaster.get_updates_since_version(version)
     return {
         "since_version": version,
         "current_version": broadcaster.current_version,
-        "updates_count": len(updates),
-        "updates": updates,
-        "needs_full_sync": len(updates) == 0 and version < broadcaster.current_version
+        "compacted": compact,
+        "updates_count": len(updates or []),
+        "updates": updates or [],
+        "needs_full_sync": updates is None
     }
 
 @router.get("/updates/sync")
@@ -166,11 +196,13 @@ async def sync_check(client_hash: Optional[str] = Query(None)):
     
     if client_hash and client_hash != broadcaster.current_hash:
         response["sync_needed"] = True
-        response["updates"] = broadcaster.get_updates_since_hash(client_hash)
+        updates = broadcaster.get_updates_since_hash(client_hash)
         
-        # If no updates found but hash mismatch, full reload needed
-        if not response["updates"]:
+        # Unknown or too old a hash: the missed updates can't be replayed
+        if updates is None:
             response["full_reload_needed"] = True
+        else:
+            response["updates"] = updates
     
     return response
 
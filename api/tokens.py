@@ -1,27 +1,93 @@
 # Token management API endpoints
 
-from typing import Dict, Any, List
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Header, Response
 
 from models.tokens import TokenUpdate, TokenBatchUpdate
 from core.token_manager import token_manager
 
 router = APIRouter()
 
+def _parse_expected_version(if_match: Optional[str], expected_version: Optional[int]) -> Optional[int]:
+    """Get the precondition version from an If-Match header or expected_version parameter"""
+    if expected_version is not None:
+        return expected_version
+    
+    if not if_match or if_match.strip() == "*":
+        return None
+    
+    # Accept "12", W/"12" and bare 12; with a list of tags the oldest one wins
+    versions = []
+    for tag in if_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        try:
+            versions.append(int(tag.strip('"')))
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid If-Match header: {if_match}"
+            )
+    
+    return min(versions) if versions else None
+
 @router.get("/", response_model=Dict[str, Any])
-async def get_all_tokens():
+async def get_all_tokens(
+    response: Response,
+    flat: bool = Query(False, description="Return a flat {dot.path: token} mapping"),
+    resolved: bool = Query(False, description="Replace token references with their resolved values")
+):
     """Get all design tokens"""
-    return await token_manager.load_tokens()
+    tokens = await token_manager.load_tokens()
+    response.headers["ETag"] = f'"{tokens.get("$metadata", {}).get("version", 0)}"'
+    
+    if flat:
+        return await token_manager.list_tokens(resolved=resolved)
+    if resolved:
+        return await token_manager.get_resolved_tokens()
+    return tokens
+
+@router.get("/hashes")
+@router.get("/hashes/{token_path:path}")
+async def get_token_hashes(
+    token_path: str = "",
+    depth: int = Query(1, ge=0, le=32, description="How many levels of descendant hashes to include")
+):
+    """Get Merkle hashes for a group and its descendants, so clients fetch only differing subtrees"""
+    return await token_manager.get_subtree_hashes(token_path.replace('/', '.'), depth)
+
+@router.get("/dependents/{token_path:path}")
+async def get_token_dependents(token_path: str):
+    """Get every token that references a token or group (e.g., 'color/primitive/blue/500')"""
+    return await token_manager.get_token_dependents(token_path.replace('/', '.'))
 
 @router.get("/{token_path:path}")
-async def get_token(token_path: str):
+async def get_token(
+    token_path: str,
+    response: Response,
+    flat: bool = Query(False, description="Return every token under the path as a flat mapping"),
+    resolved: bool = Query(False, description="Replace token references with their resolved values")
+):
     """Get a specific token by path (e.g., 'color/semantic/primary')"""
     # Convert URL path to dot notation
     dot_path = token_path.replace('/', '.')
-    return await token_manager.get_token_by_path(dot_path)
+    if flat:
+        result = await token_manager.list_tokens(dot_path, resolved=resolved)
+    else:
+        result = await token_manager.get_token_by_path(dot_path, resolved=resolved)
+    
+    # Send the path revision back as If-Match to guard a later write
+    response.headers["ETag"] = f'"{token_manager.get_revision(dot_path)}"'
+    return result
 
 @router.put("/{token_path:path}")
-async def update_token(token_path: str, update: TokenUpdate):
+async def update_token(
+    token_path: str,
+    update: TokenUpdate,
+    if_match: Optional[str] = Header(None),
+    expected_version: Optional[int] = Query(None, description="Reject with 409 if the token changed after this version")
+):
     """Update a specific token"""
     dot_path = token_path.replace('/', '.')
     
@@ -29,45 +95,47 @@ async def update_token(token_path: str, update: TokenUpdate):
         dot_path, 
         update.value, 
         update.type, 
-        update.description
+        update.description,
+        expected_version=_parse_expected_version(
+            if_match,
+            expected_version if expected_version is not None else update.expected_version
+        )
     )
 
 @router.delete("/{token_path:path}")
-async def delete_token(token_path: str):
+async def delete_token(
+    token_path: str,
+    if_match: Optional[str] = Header(None),
+    expected_version: Optional[int] = Query(None, description="Reject with 409 if the token changed after this version")
+):
     """Delete a specific token"""
     dot_path = token_path.replace('/', '.')
-    return await token_manager.delete_token(dot_path)
+    return await token_manager.delete_token(
+        dot_path,
+        expected_version=_parse_expected_version(if_match, expected_version)
+    )
 
 @router.post("/batch")
-async def batch_update_tokens(updates: TokenBatchUpdate):
-    """Update multiple tokens at once"""
-    results = []
-    
-    for update in updates.tokens:
-        try:
-            result = await token_manager.update_token(
-                update.token_path,
-                update.value,
-                update.type,
-                update.description
-            )
-            results.append({
-                "success": True,
-                "token_path": update.token_path,
-                "result": result
-            })
-        except Exception as e:
-            results.append({
-                "success": False,
-                "token_path": update.token_path,
-                "error": str(e)
-            })
-    
-    successful = len([r for r in results if r["success"]])
+async def batch_update_tokens(
+    updates: TokenBatchUpdate,
+    if_match: Optional[str] = Header(None)
+):
+    """Update multiple tokens at once, as a single all-or-nothing commit"""
+    results = await token_manager.batch_update_tokens(
+        [update.model_dump() for update in updates.tokens],
+        expected_version=_parse_expected_version(if_match, updates.expected_version)
+    )
     
     return {
         "total_updates": len(updates.tokens),
-        "successful": successful,
-        "failed": len(results) - successful,
-        "results": results
-    }
\ No newline at end of file
+        "successful": len(results),
+        "failed": 0,
+        "results": [
+            {
+                "success": True,
+                "token_path": result["token_path"],
+                "result": result
+            }
+            for result in results
+        ]
+    }
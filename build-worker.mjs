@@ -0,0 +1,78 @@
+// Long-lived Style Dictionary build worker.
+//
+// Loads style-dictionary.config.js once and serves build jobs from
+// core/node_worker.py over newline-delimited JSON on stdin/stdout:
+//
+//   -> {"id": 1, "type": "build", "platform": "ios"}
+//   <- {"id": 1, "ok": true}
+//   -> {"id": 2, "type": "build", "platform": "android", "files": ["DesignTokens.java"], "buildPath": "dist/.versions/android/.staging-…/files/"}
+//   <- {"id": 2, "ok": true}
+//   -> {"id": 3, "type": "ping"}
+//   <- {"id": 3, "ok": true}
+//
+// Style Dictionary's own logging is redirected to stderr so stdout only
+// carries protocol messages.
+
+import path from 'node:path';
+import readline from 'node:readline';
+import { pathToFileURL } from 'node:url';
+
+const send = (message) => process.stdout.write(JSON.stringify(message) + '\n');
+console.log = console.error;
+console.info = console.error;
+
+const configPath = path.resolve(process.argv[2] || 'style-dictionary.config.js');
+
+async function main() {
+  const { default: StyleDictionary } = await import('style-dictionary');
+  const configModule = await import(pathToFileURL(configPath).href);
+  const config = configModule.default ?? configModule;
+
+  async function build(job) {
+    if (!config.platforms?.[job.platform]) {
+      throw new Error(`Unknown platform '${job.platform}'`);
+    }
+    // An incremental build only writes the listed destinations; other files are left as they are
+    let platform = config.platforms[job.platform];
+    if (Array.isArray(job.files)) {
+      platform = { ...platform, files: platform.files.filter((file) => job.files.includes(file.destination)) };
+    }
+    // Builds are written into a staging directory and published once complete
+    if (job.buildPath) {
+      platform = { ...platform, buildPath: job.buildPath };
+    }
+    // Token sources are re-read for every job; only config and module loading are amortized
+    const sd = new StyleDictionary({ ...config, platforms: { ...config.platforms, [job.platform]: platform } });
+    await sd.buildPlatform(job.platform);
+  }
+
+  // Jobs are handled one at a time, in order
+  let queue = Promise.resolve();
+  const lines = readline.createInterface({ input: process.stdin });
+
+  lines.on('line', (line) => {
+    queue = queue.then(async () => {
+      let job;
+      try {
+        job = JSON.parse(line);
+        if (job.type === 'build') {
+          await build(job);
+        } else if (job.type !== 'ping') {
+          throw new Error(`Unknown job type '${job.type}'`);
+        }
+        send({ id: job.id, ok: true });
+      } catch (error) {
+        send({ id: job?.id ?? null, ok: false, error: String(error?.stack || error) });
+      }
+    });
+  });
+
+  lines.on('close', () => queue.then(() => process.exit(0)));
+
+  send({ type: 'ready', pid: process.pid });
+}
+
+main().catch((error) => {
+  send({ type: 'fatal', error: String(error?.stack || error) });
+  process.exit(1);
+});
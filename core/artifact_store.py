@@ -0,0 +1,376 @@
+# Immutable, versioned platform build outputs published by symlink swap
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Precompressed variants stored next to each artifact, in order of preference
+COMPRESSED_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+MEDIA_TYPES = {
+    ".css": "text/css",
+    ".scss": "text/scss",
+    ".swift": "text/x-swift",
+    ".h": "text/x-c",
+    ".xml": "application/xml",
+    ".java": "text/x-java",
+    ".dart": "text/x-dart",
+    ".json": "application/json",
+    ".js": "text/javascript"
+}
+
+def media_type_for(name: str) -> str:
+    """Get the media type to serve an artifact with"""
+    suffix = Path(name).suffix
+    return MEDIA_TYPES.get(suffix) or mimetypes.guess_type(name)[0] or "text/plain"
+
+def is_compressed_variant(path: Path) -> bool:
+    """Check whether a file is a precompressed copy of a sibling artifact"""
+    return path.suffix in COMPRESSED_SUFFIXES.values() and path.with_suffix("").exists()
+
+def available_encodings(encodings: List[str]) -> List[str]:
+    """Filter configured encodings down to the ones this install can produce"""
+    return [
+        encoding for encoding in COMPRESSED_SUFFIXES
+        if encoding in encodings and (encoding != "zstd" or zstandard is not None)
+    ]
+
+def compress_artifacts(output_dir: Path, encodings: List[str], min_bytes: int) -> None:
+    """Write compressed variants of every artifact that lacks an up-to-date one"""
+    enabled = available_encodings(encodings)
+
+    for file_path in [path for path in output_dir.rglob('*') if path.is_file() and not is_compressed_variant(path)]:
+        stat = file_path.stat()
+        data = None
+
+        for encoding, suffix in COMPRESSED_SUFFIXES.items():
+            variant = file_path.with_name(file_path.name + suffix)
+            # Files carried over unchanged from the previous version keep their variants
+            if encoding in enabled and variant.exists() and variant.stat().st_mtime_ns >= stat.st_mtime_ns:
+                continue
+
+            variant.unlink(missing_ok=True)
+            if encoding not in enabled or stat.st_size < min_bytes:
+                continue
+
+            if data is None:
+                data = file_path.read_bytes()
+            if encoding == "gzip":
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            else:
+                compressed = zstandard.ZstdCompressor(level=19).compress(data)
+
+            # Not worth serving if compression doesn't pay off
+            if len(compressed) < len(data):
+                variant.write_bytes(compressed)
+
+def build_manifest(output_dir: Path) -> Dict[str, Any]:
+    """Describe every artifact of a build: size, mtime, content hash, media type and variants"""
+    files = []
+    for file_path in output_dir.rglob('*'):
+        if not file_path.is_file() or is_compressed_variant(file_path):
+            continue
+
+        stat = file_path.stat()
+        encodings = {}
+        for encoding, suffix in COMPRESSED_SUFFIXES.items():
+            variant = file_path.with_name(file_path.name + suffix)
+            if variant.is_file():
+                encodings[encoding] = variant.stat().st_size
+
+        files.append({
+            "name": file_path.name,
+            "path": str(file_path.relative_to(output_dir)),
+            "size": stat.st_size,
+            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "extension": file_path.suffix,
+            "sha256": hashlib.sha256(file_path.read_bytes()).hexdigest(),
+            "media_type": media_type_for(file_path.name),
+            "encodings": encodings
+        })
+
+    # Newest first, as the platform endpoints have always listed them
+    files.sort(key=lambda file: file["modified"], reverse=True)
+    return {
+        "files": files,
+        "file_count": len(files),
+        "total_size_bytes": sum(file["size"] for file in files),
+        "last_modified": files[0]["modified"] if files else None
+    }
+
+def negotiate_encoding(
+    file_path: Path,
+    accept_encoding: Optional[str],
+    variants: Dict[str, int]
+) -> Tuple[Path, Optional[str]]:
+    """Pick the best of a file's precompressed variants (encoding -> size) the client accepts"""
+    accepted: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    # Highest q wins; server preference order only breaks ties
+    best, best_quality = None, 0.0
+    for encoding in COMPRESSED_SUFFIXES:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in variants and quality > best_quality:
+            best, best_quality = encoding, quality
+
+    # Identity stays acceptable unless refused, and beats a less preferred compression
+    if best is None or accepted.get("identity", best_quality) > best_quality:
+        return file_path, None
+    return file_path.with_name(file_path.name + COMPRESSED_SUFFIXES[best]), best
+
+class ArtifactStore:
+    """Keeps every platform build in its own immutable version directory"""
+
+    def __init__(self, build_dir: Path, max_versions: int, max_bytes: int):
+        self.build_dir = build_dir
+        # .versions/<platform>/<key>/ holds files/, entry.json and manifest.json of one build;
+        # dist/<platform> is a symlink to the published one
+        self.root = build_dir / ".versions"
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # In-memory views so reads don't touch the filesystem: the published key per
+        # platform and the manifest of each version (versions never change once sealed)
+        self._published: Dict[str, Optional[str]] = {}
+        self._manifests: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    @staticmethod
+    def make_key(token_hash: str, config_hash: str, platform: str, builder_version: str, nonce: str = "") -> str:
+        """Derive the version key for one platform build"""
+        # A forced rebuild adds a nonce so it never reuses a directory readers may hold
+        material = json.dumps([token_hash, config_hash, platform, builder_version] + ([nonce] if nonce else []))
+        return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+    @staticmethod
+    def _valid_key(key: str) -> bool:
+        return bool(key) and all(c in "0123456789abcdef" for c in key)
+
+    def version_dir(self, platform: str, key: str) -> Path:
+        return self.root / platform / key
+
+    def lookup(self, platform: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get the stored build result for a cache key, counting the hit or miss"""
+        # The published version wins: after a forced rebuild it holds the fresh output
+        current = self.current_key(platform)
+        for version_key in ([current] if current and current != key else []) + [key]:
+            entry = self.read_entry(platform, version_key)
+            if entry is not None and entry.get("cache_key", version_key) == key:
+                self.hits += 1
+                return {**entry, "version_key": version_key}
+        self.misses += 1
+        return None
+
+    def read_entry(self, platform: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get the stored build result for a version, if it exists"""
+        try:
+            with open(self.version_dir(platform, key) / "entry.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def create_staging(self, platform: str, base_key: Optional[str] = None) -> Path:
+        """Create a private output directory to build into, optionally seeded from a version"""
+        platform_root = self.root / platform
+        platform_root.mkdir(parents=True, exist_ok=True)
+        output_dir = platform_root / f".staging-{uuid.uuid4().hex}" / "files"
+
+        if base_key is not None:
+            # Copies, not hard links: Style Dictionary rewrites files in place
+            shutil.copytree(self.version_dir(platform, base_key) / "files", output_dir)
+        else:
+            output_dir.mkdir(parents=True)
+        return output_dir
+
+    def discard(self, output_dir: Path) -> None:
+        """Throw away an unfinished build"""
+        shutil.rmtree(output_dir.parent, ignore_errors=True)
+
+    def commit(
+        self,
+        platform: str,
+        key: str,
+        output_dir: Path,
+        result: Dict[str, Any],
+        manifest: Dict[str, Any]
+    ) -> None:
+        """Seal a finished build and its manifest as an immutable version"""
+        with open(output_dir.parent / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        with open(output_dir.parent / "entry.json", 'w', encoding='utf-8') as f:
+            json.dump({**result, "version_key": key}, f, indent=2)
+
+        try:
+            os.rename(output_dir.parent, self.version_dir(platform, key))
+        except OSError:
+            # The same version was committed meanwhile; it has identical content
+            self.discard(output_dir)
+
+    def publish(self, platform: str, key: str) -> None:
+        """Point dist/<platform> at a version in one atomic rename"""
+        link = self.build_dir / platform
+        temp_link = self.build_dir / f".{platform}.link-{uuid.uuid4().hex}"
+        os.symlink(os.path.join(".versions", platform, key, "files"), temp_link)
+
+        if link.is_dir() and not link.is_symlink():
+            # Output of a build made before versioning; move it out of the way once
+            retired = self.build_dir / f".{platform}.old-{uuid.uuid4().hex}"
+            os.rename(link, retired)
+            shutil.rmtree(retired, ignore_errors=True)
+
+        os.replace(temp_link, link)
+        self._published[platform] = key
+        self.touch(platform, key)
+
+    def unpublish(self, platform: str) -> None:
+        """Stop serving a platform; its versions stay available"""
+        self._published[platform] = None
+        link = self.build_dir / platform
+        if link.is_symlink():
+            link.unlink()
+        elif link.is_dir():
+            shutil.rmtree(link)
+
+    def touch(self, platform: str, key: str) -> None:
+        """Mark a version as recently used"""
+        try:
+            os.utime(self.version_dir(platform, key))
+        except OSError:
+            pass
+
+    def current_key(self, platform: str) -> Optional[str]:
+        """Get the key of the published version of a platform"""
+        if platform not in self._published:
+            self._published[platform] = self._read_current_key(platform)
+        return self._published[platform]
+
+    def _read_current_key(self, platform: str) -> Optional[str]:
+        try:
+            target = os.readlink(self.build_dir / platform)
+        except OSError:
+            return None
+        key = os.path.basename(os.path.dirname(target))
+        return key if self.version_dir(platform, key).is_dir() else None
+
+    def manifest(self, platform: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get the manifest of a pinned version, or of the published one"""
+        key = version or self.current_key(platform)
+        if key is None or not self._valid_key(key):
+            return None
+
+        manifest = self._manifests.get((platform, key))
+        if version is not None and (manifest is not None or self.version_dir(platform, key).is_dir()):
+            # Reads of a pinned version keep it from being evicted as unused
+            self.touch(platform, key)
+        if manifest is None:
+            manifest = self._load_manifest(platform, key)
+            if manifest is None:
+                return None
+            manifest = {
+                **manifest,
+                "version": key,
+                "index": {file["path"]: file for file in manifest["files"]}
+            }
+            self._manifests[(platform, key)] = manifest
+        return manifest
+
+    def _load_manifest(self, platform: str, key: str) -> Optional[Dict[str, Any]]:
+        directory = self.version_dir(platform, key)
+        if not (directory / "entry.json").exists():
+            return None
+        try:
+            with open(directory / "manifest.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # Sealed before manifests were written
+            return build_manifest(directory / "files")
+
+    def list_versions(self, platform: str) -> List[Dict[str, Any]]:
+        """Get the retained versions of a platform, most recently used first"""
+        current = self.current_key(platform)
+        versions = []
+        for directory in self._version_dirs(platform):
+            entry = self.read_entry(platform, directory.name) or {}
+            versions.append({
+                "version": directory.name,
+                "current": directory.name == current,
+                "tokens_version": entry.get("tokens_version"),
+                "build_time": entry.get("build_time"),
+                "size_bytes": sum(entry.get("file_sizes", {}).values()),
+                "last_used": directory.stat().st_mtime
+            })
+        versions.sort(key=lambda version: version["last_used"], reverse=True)
+        return versions
+
+    def evict(self, platform: str) -> None:
+        """Drop least recently used versions beyond the count and size limits"""
+        current = self.current_key(platform)
+        versions = self.list_versions(platform)
+        total_bytes = sum(version["size_bytes"] for version in versions)
+        kept = len(versions)
+
+        for version in reversed(versions):
+            if kept <= self.max_versions and total_bytes <= self.max_bytes:
+                break
+            if version["version"] == current:
+                continue
+            # Rename first so the version disappears atomically, then delete at leisure
+            doomed = self.root / platform / f".evicted-{uuid.uuid4().hex}"
+            try:
+                os.rename(self.version_dir(platform, version["version"]), doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            self._manifests.pop((platform, version["version"]), None)
+            kept -= 1
+            total_bytes -= version["size_bytes"]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every version of every platform"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._published.clear()
+        self._manifests.clear()
+
+    def _version_dirs(self, platform: str) -> List[Path]:
+        platform_root = self.root / platform
+        if not platform_root.exists():
+            return []
+        return [path for path in platform_root.iterdir() if path.is_dir() and not path.name.startswith(".")]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and the number of stored versions"""
+        platforms = [path.name for path in self.root.iterdir() if path.is_dir()] if self.root.exists() else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "versions": {platform: len(self._version_dirs(platform)) for platform in platforms},
+            "max_versions_per_platform": self.max_versions,
+            "max_bytes_per_platform": self.max_bytes
+        }
@@ -0,0 +1,169 @@
+# In-process emitters for the Style Dictionary formats that need no Node transforms
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from core.fileutil import atomic_write
+
+# (path parts, token, resolved $value) in document order
+BuildToken = Tuple[List[str], Dict[str, Any], Any]
+
+# Output files per natively built platform. Keep in sync with style-dictionary.config.js;
+# platforms or formats not listed here are still built by Style Dictionary.
+NATIVE_PLATFORM_FILES: Dict[str, List[Dict[str, Any]]] = {
+    "web": [
+        {"destination": "tokens.css", "format": "css/variables", "selector": ":root"},
+        {"destination": "tokens.json", "format": "json/flat"},
+        {"destination": "tokens-nested.json", "format": "json/nested"}
+    ],
+    "scss": [
+        {"destination": "tokens.scss", "format": "scss/variables"}
+    ],
+    "json": [
+        {"destination": "tokens-flat.json", "format": "json/flat"},
+        {"destination": "tokens-nested.json", "format": "json/nested"}
+    ]
+}
+
+# Output files of the platforms Style Dictionary builds. Only used to plan incremental
+# rebuilds; keep in sync with style-dictionary.config.js
+STYLE_DICTIONARY_PLATFORM_FILES: Dict[str, List[Dict[str, Any]]] = {
+    "ios": [
+        {"destination": "DesignTokens.swift", "format": "ios-swift/class.swift"},
+        {"destination": "DesignTokens.h", "format": "ios/macros"}
+    ],
+    "android": [
+        {"destination": "design_tokens.xml", "format": "android/resources"},
+        {"destination": "DesignTokens.java", "format": "android/colors"}
+    ],
+    "flutter": [
+        {"destination": "design_tokens.dart", "format": "flutter/class.dart"}
+    ]
+}
+
+# Formats that only ever output tokens of some types. A file entry can also list
+# "token_types" to mirror a $type filter set on it in the config.
+FORMAT_TOKEN_TYPES: Dict[str, Set[str]] = {
+    "android/colors": {"color"}
+}
+
+HEADER = "Do not edit directly, this file was auto-generated."
+
+def kebab_name(path_parts: List[str]) -> str:
+    """Style Dictionary's name/kebab transform: ['color', 'brandPrimary'] -> 'color-brand-primary'"""
+    words = []
+    for part in path_parts:
+        part = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", part)
+        part = re.sub(r"([A-Z])([A-Z][a-z])", r"\1 \2", part)
+        words.extend(word.lower() for word in re.split(r"[^A-Za-z0-9]+", part) if word)
+    return "-".join(words)
+
+def css_value(value: Any) -> str:
+    """Format a resolved value for CSS/SCSS output"""
+    if isinstance(value, (list, tuple)):
+        # fontFamily stacks: quote names containing spaces
+        return ", ".join(
+            f"'{item}'" if isinstance(item, str) and " " in item else str(item)
+            for item in value
+        )
+    if isinstance(value, dict):
+        # Composite shadow values
+        return " ".join(
+            str(value[key])
+            for key in ("offsetX", "offsetY", "blur", "spread", "color")
+            if key in value
+        )
+    return str(value)
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    return value
+
+def emit_css_variables(tokens: List[BuildToken], options: Dict[str, Any]) -> Iterator[str]:
+    yield f"/**\n * {HEADER}\n */\n\n"
+    yield f"{options.get('selector', ':root')} {{\n"
+    for path_parts, _, value in tokens:
+        yield f"  --{kebab_name(path_parts)}: {css_value(value)};\n"
+    yield "}\n"
+
+def emit_scss_variables(tokens: List[BuildToken], options: Dict[str, Any]) -> Iterator[str]:
+    yield f"\n// {HEADER}\n\n"
+    for path_parts, _, value in tokens:
+        yield f"${kebab_name(path_parts)}: {css_value(value)};\n"
+
+def emit_json_flat(tokens: List[BuildToken], options: Dict[str, Any]) -> Iterator[str]:
+    yield "{\n"
+    for position, (path_parts, _, value) in enumerate(tokens):
+        separator = ",\n" if position < len(tokens) - 1 else "\n"
+        encoded = json.dumps(_json_value(value), ensure_ascii=False)
+        yield f"  {json.dumps(kebab_name(path_parts))}: {encoded}{separator}"
+    yield "}\n"
+
+def emit_json_nested(tokens: List[BuildToken], options: Dict[str, Any]) -> Iterator[str]:
+    nested: Dict[str, Any] = {}
+    for path_parts, _, value in tokens:
+        current = nested
+        for part in path_parts[:-1]:
+            current = current.setdefault(part, {})
+        current[path_parts[-1]] = _json_value(value)
+    yield json.dumps(nested, indent=2, ensure_ascii=False)
+    yield "\n"
+
+def platform_files(platform: str) -> List[Dict[str, Any]]:
+    """Get the output files of a platform, whichever engine builds it"""
+    return NATIVE_PLATFORM_FILES.get(platform) or STYLE_DICTIONARY_PLATFORM_FILES.get(platform, [])
+
+def affected_files(platform: str, token_types: Set[Optional[str]]) -> List[str]:
+    """Get the destinations of a platform that can contain tokens of the given types"""
+    affected = []
+    for file in platform_files(platform):
+        accepted = file.get("token_types") or FORMAT_TOKEN_TYPES.get(file["format"])
+        # Untyped tokens may inherit a type from their group, so they match any filter
+        if accepted is None or None in token_types or not token_types.isdisjoint(accepted):
+            affected.append(file["destination"])
+    return affected
+
+FORMATS = {
+    "css/variables": emit_css_variables,
+    "scss/variables": emit_scss_variables,
+    "json/flat": emit_json_flat,
+    "json/nested": emit_json_nested
+}
+
+class PythonBuildEngine:
+    """Builds the web, scss and json platforms in-process from the resident token document"""
+
+    VERSION = "1"
+
+    def supports(self, platform: str) -> bool:
+        """Check whether every file of a platform can be emitted without Style Dictionary"""
+        files = NATIVE_PLATFORM_FILES.get(platform)
+        return bool(files) and all(file["format"] in FORMATS for file in files)
+
+    def build_platform(
+        self,
+        platform: str,
+        tokens: List[BuildToken],
+        output_dir: Path,
+        files: Optional[List[str]] = None
+    ) -> List[str]:
+        """Write the output files of a platform (all, or only `files`) and return their names"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+
+        for file in NATIVE_PLATFORM_FILES[platform]:
+            if files is not None and file["destination"] not in files:
+                continue
+            self._write_file(output_dir / file["destination"], FORMATS[file["format"]](tokens, file))
+            written.append(file["destination"])
+
+        return written
+
+    def _write_file(self, path: Path, chunks: Iterator[str]) -> None:
+        """Stream chunks into a temp file and rename it into place"""
+        atomic_write(path, (chunk.encode('utf-8') for chunk in chunks))
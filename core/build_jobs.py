@@ -0,0 +1,146 @@
+# Background build jobs with single-flight deduplication
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings
+
+class BuildJob:
+    """One queued or finished build of a set of platforms"""
+
+    def __init__(self, platforms: List[str], force_rebuild: bool, token_hash: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.platforms = platforms
+        self.force_rebuild = force_rebuild
+        self.token_hash = token_hash
+        self.status = "queued"
+        self.requests = 1
+        self.submitted_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.duration_ms: Optional[int] = None
+        self.results: Optional[Dict[str, Dict[str, Any]]] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def key(self) -> Tuple[str, Tuple[str, ...], bool]:
+        return (self.token_hash, tuple(sorted(set(self.platforms))), self.force_rebuild)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "platforms": self.platforms,
+            "force_rebuild": self.force_rebuild,
+            "token_hash": self.token_hash,
+            "requests": self.requests,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_ms": self.duration_ms,
+            "error": self.error
+        }
+
+class BuildJobQueue:
+    """Runs builds as background jobs, at most BUILD_MAX_CONCURRENT_JOBS at once"""
+
+    def __init__(self):
+        self.jobs: "OrderedDict[str, BuildJob]" = OrderedDict()
+        # Unfinished jobs by (token hash, platforms, force); identical requests join these
+        self._active: Dict[Tuple[str, Tuple[str, ...], bool], BuildJob] = {}
+        self._slots = asyncio.Semaphore(settings.BUILD_MAX_CONCURRENT_JOBS)
+
+    async def submit(self, platforms: List[str], force_rebuild: bool = False) -> Tuple[BuildJob, bool]:
+        """Queue a build, or join an identical unfinished one; returns (job, created)"""
+        # Import here to avoid circular import
+        from core.token_manager import token_manager
+
+        job = BuildJob(platforms, force_rebuild, await token_manager.get_tokens_hash())
+
+        existing = self._active.get(job.key)
+        if existing is not None:
+            existing.requests += 1
+            return existing, False
+
+        self._active[job.key] = job
+        self.jobs[job.id] = job
+        self._trim_history()
+        job.task = asyncio.create_task(self._run(job))
+        return job, True
+
+    def get_job(self, job_id: str) -> Optional[BuildJob]:
+        """Get a job by ID"""
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[BuildJob]:
+        """Get every retained job, newest first"""
+        return list(reversed(self.jobs.values()))
+
+    def cancel(self, job: BuildJob) -> bool:
+        """Cancel an unfinished job that no other request has joined"""
+        if job.finished or job.requests > 1 or job.task is None:
+            return False
+        job.task.cancel()
+        return True
+
+    async def wait(self, job: BuildJob) -> BuildJob:
+        """Wait for a job to finish"""
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        return job
+
+    async def _run(self, job: BuildJob) -> None:
+        # Import here to avoid circular import
+        from core.style_dictionary import style_builder
+
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.started_at = datetime.now().isoformat()
+                build_start = time.time()
+
+                try:
+                    job.results = await style_builder.build_platforms(job.platforms, force_rebuild=job.force_rebuild)
+                    job.status = "succeeded" if all(r["success"] for r in job.results.values()) else "failed"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = str(e)
+
+                job.duration_ms = int((time.time() - build_start) * 1000)
+                job.finished_at = datetime.now().isoformat()
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.finished_at = datetime.now().isoformat()
+            raise
+        finally:
+            self._active.pop(job.key, None)
+
+        print(f"🧾 Build job {job.id} {job.status} ({', '.join(job.platforms)})")
+
+    def _trim_history(self) -> None:
+        # Keep unfinished jobs; drop the oldest finished ones beyond the limit
+        excess = len(self.jobs) - settings.BUILD_JOB_HISTORY_SIZE
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:max(excess, 0)]:
+            del self.jobs[job_id]
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get queue counters for the build status endpoint"""
+        statuses = [job.status for job in self.jobs.values()]
+        return {
+            "max_concurrent_jobs": settings.BUILD_MAX_CONCURRENT_JOBS,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "retained": len(statuses)
+        }
+
+# Global build job queue instance
+build_jobs = BuildJobQueue()
@@ -0,0 +1,130 @@
+# Debounced background builds after token saves (opt-in via AUTO_BUILD_ENABLED)
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from core.config import settings
+
+class BuildScheduler:
+    """Rebuilds platforms once token edits have been quiet for AUTO_BUILD_DEBOUNCE_MS"""
+
+    def __init__(self):
+        self.pending_version: Optional[int] = None
+        self.building_version: Optional[int] = None
+        self.last_built_version: Optional[int] = None
+        self.last_build: Optional[Dict[str, Any]] = None
+        self.stats = {"started": 0, "completed": 0, "cancelled": 0, "failed": 0}
+        self._timer: Optional[asyncio.Task] = None
+        self._build: Optional[asyncio.Task] = None
+        self._job = None
+
+    def notify(self, version: int) -> None:
+        """Record a new token version and restart the quiet period"""
+        self.pending_version = version
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.create_task(self._debounce())
+
+    async def shutdown(self) -> None:
+        """Cancel the pending timer and any running build"""
+        for task in (self._timer, self._build):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._timer = None
+        self._build = None
+
+    async def _debounce(self) -> None:
+        await asyncio.sleep(settings.AUTO_BUILD_DEBOUNCE_MS / 1000)
+        self._timer = None
+
+        version = self.pending_version
+        if version is None or version == self.last_built_version:
+            return
+
+        if self._build is not None and not self._build.done():
+            if self.building_version == version:
+                return
+            # Import here to avoid circular import
+            from core.build_jobs import build_jobs
+
+            # The running build is for an older version; its output would be stale on arrival.
+            # Its job keeps running if a manual build request joined it.
+            if self._job is not None:
+                build_jobs.cancel(self._job)
+            self._build.cancel()
+            await asyncio.gather(self._build, return_exceptions=True)
+
+        self._build = asyncio.create_task(self._run_build(version))
+
+    async def _run_build(self, version: int) -> None:
+        # Import here to avoid circular import
+        from core.build_jobs import build_jobs
+        from core.update_broadcaster import broadcaster
+
+        self.building_version = version
+        self.stats["started"] += 1
+        build_start = time.time()
+
+        try:
+            # Through the job queue, so the concurrency cap and single-flight dedupe apply
+            job, _ = await build_jobs.submit(
+                settings.AUTO_BUILD_PLATFORMS or settings.PLATFORMS + ['scss', 'json']
+            )
+            self._job = job
+            await build_jobs.wait(job)
+            if job.results is None:
+                raise RuntimeError(job.error or "build job failed")
+            results = job.results
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            print(f"⏹️  Auto-build for v{version} cancelled by a newer version")
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"❌ Auto-build for v{version} failed: {e}")
+            return
+        finally:
+            self.building_version = None
+            self._job = None
+
+        self.stats["completed"] += 1
+        self.last_built_version = version
+        self.last_build = {
+            "artifact_version": version,
+            "job_id": job.id,
+            "hash": job.token_hash,
+            "success": all(result["success"] for result in results.values()),
+            "build_duration_ms": int((time.time() - build_start) * 1000),
+            "completed_at": datetime.now().isoformat(),
+            "platforms": {
+                platform: {
+                    "success": result["success"],
+                    "cache_key": result.get("cache_key"),
+                    "cached": result.get("cached", False),
+                    "skipped": result.get("skipped", False),
+                    "output_files": result["output_files"],
+                    "error": result.get("error")
+                }
+                for platform, result in results.items()
+            }
+        }
+
+        await broadcaster.broadcast_build_complete(self.last_build)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get scheduler state for the build status endpoint"""
+        return {
+            "enabled": settings.AUTO_BUILD_ENABLED,
+            "debounce_ms": settings.AUTO_BUILD_DEBOUNCE_MS,
+            "pending_version": self.pending_version,
+            "building_version": self.building_version,
+            "last_built_version": self.last_built_version,
+            "last_build": self.last_build,
+            "stats": self.stats
+        }
+
+# Global build scheduler instance
+build_scheduler = BuildScheduler()
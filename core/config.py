@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -24,9 +24,71 @@ class Settings(BaseSettings):
     WEBSOCKET_PING_INTERVAL: int = 30  # seconds
     MAX_WEBSOCKET_CONNECTIONS: int = 1000
     
+    # SSE fan-out: updates are pushed to a bounded queue per client. A client that
+    # falls this far behind is told to resync instead of holding up the rest.
+    SSE_QUEUE_SIZE: int = 256
+    SSE_HEARTBEAT_INTERVAL: float = 30.0  # seconds
+    
+    # Token updates kept in memory for reconnecting clients to catch up from
+    UPDATE_HISTORY_SIZE: int = 10000
+    
+    # Catch-up ranges whose folded net delta is kept, least recently used evicted first
+    UPDATE_DELTA_CACHE_SIZE: int = 64
+    
+    # Updates are journaled to disk and replayed at startup so versions continue across
+    # restarts; the directory defaults to TOKENS_DIR/.journal
+    UPDATE_JOURNAL_ENABLED: bool = True
+    UPDATE_JOURNAL_DIR: Optional[Path] = None
+    UPDATE_JOURNAL_SEGMENT_BYTES: int = 4 * 1024 * 1024
+    UPDATE_JOURNAL_FSYNC: bool = True
+    
+    # Token write pipeline: mutations arriving within the window share one commit
+    TOKEN_COMMIT_WINDOW_MS: int = 5
+    TOKEN_COMMIT_MAX_BATCH: int = 256
+    
+    # Commits remembered for incremental rebuilds; older builds are rebuilt in full
+    TOKEN_CHANGE_LOG_SIZE: int = 1000
+    
+    # Batch updates are applied in one commit, so cost grows with batch size only
+    MAX_BATCH_SIZE: int = 5000
+    
     # Style Dictionary settings
     STYLE_DICTIONARY_CONFIG: str = "style-dictionary.config.js"
     
+    # Platforms emitted in-process by core.build_engine; others run Style Dictionary
+    NATIVE_BUILD_PLATFORMS: List[str] = ["web", "scss", "json"]
+    
+    # Platform builds run concurrently; 0 means one slot per CPU
+    BUILD_CONCURRENCY: int = 0
+    BUILD_PLATFORM_TIMEOUT: float = 180.0  # seconds
+    
+    # POST /build runs as background jobs; identical requests share one job
+    BUILD_MAX_CONCURRENT_JOBS: int = 2
+    BUILD_JOB_HISTORY_SIZE: int = 100
+    
+    # Background builds after token saves, once edits have been quiet for the debounce
+    # period. An empty platform list builds every platform.
+    AUTO_BUILD_ENABLED: bool = False
+    AUTO_BUILD_DEBOUNCE_MS: int = 500
+    AUTO_BUILD_PLATFORMS: List[str] = []
+    
+    # Build versions kept per platform under BUILD_DIR/.versions, evicted least recently
+    # used first; the published version is always kept
+    ARTIFACT_MAX_VERSIONS: int = 20
+    ARTIFACT_MAX_BYTES: int = 200 * 1024 * 1024
+    
+    # Compressed variants written next to each artifact at build time and served by
+    # Accept-Encoding; zstd is skipped unless the zstandard package is installed
+    ARTIFACT_COMPRESSION: List[str] = ["gzip", "zstd"]
+    ARTIFACT_COMPRESSION_MIN_BYTES: int = 256
+    
+    # Persistent Style Dictionary workers (build-worker.mjs); 0 disables them in favour of npx
+    NODE_WORKER_POOL_SIZE: int = 2
+    NODE_WORKER_START_TIMEOUT: float = 30.0  # seconds
+    NODE_WORKER_BUILD_TIMEOUT: float = 120.0
+    NODE_WORKER_PING_TIMEOUT: float = 5.0
+    NODE_WORKER_HEALTH_INTERVAL: float = 30.0
+    
     # Token validation
     VALID_TOKEN_TYPES: List[str] = [
         "color", "dimension", "fontFamily", "fontWeight", 
@@ -0,0 +1,43 @@
+# Atomic file replacement shared by the token store and the build engine
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable
+
+# Process umask, read once: mkstemp creates files 0600, but tokens.json and build
+# artifacts should get the permissions any other newly created file would
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def atomic_write(path: Path, chunks: Iterable[bytes], fsync: bool = False) -> None:
+    """Write chunks to a temp file beside `path` and rename it over `path`"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # Keep the permissions of the file being replaced
+        try:
+            mode = path.stat().st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Persist the rename itself
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
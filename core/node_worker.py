@@ -0,0 +1,211 @@
+# Persistent Style Dictionary worker processes (see build-worker.mjs)
+
+import asyncio
+import json
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+class NodeWorkerError(Exception):
+    """Raised when a worker cannot be started or stops responding"""
+
+class NodeWorker:
+    """A single long-lived `node build-worker.mjs` process speaking JSON lines"""
+
+    def __init__(self, script: Path, config_file: Path, cwd: Path):
+        self.script = script
+        self.config_file = config_file
+        self.cwd = cwd
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.jobs_completed = 0
+        self.restarts = 0
+        self._next_id = 0
+        self._stderr_tail: deque = deque(maxlen=50)
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        """Spawn the process and wait until it has loaded Style Dictionary and the config"""
+        self.process = await asyncio.create_subprocess_exec(
+            "node", str(self.script), str(self.config_file),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd
+        )
+        self._stderr_task = asyncio.create_task(self._drain_stderr(self.process))
+
+        message = await self._read_message(settings.NODE_WORKER_START_TIMEOUT)
+        if message.get("type") != "ready":
+            await self.stop()
+            raise NodeWorkerError(message.get("error") or f"Unexpected worker message: {message}")
+
+    async def stop(self) -> None:
+        """Terminate the process"""
+        process, self.process = self.process, None
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+            self._stderr_task = None
+
+    async def restart(self) -> None:
+        """Replace the process with a fresh one"""
+        await self.stop()
+        self.restarts += 1
+        await self.start()
+
+    async def request(self, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send one job and wait for its reply"""
+        if not self.alive:
+            raise NodeWorkerError("Worker is not running")
+
+        self._next_id += 1
+        message = {**message, "id": self._next_id}
+
+        try:
+            self.process.stdin.write((json.dumps(message) + "\n").encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise NodeWorkerError(f"Worker pipe closed: {e}")
+
+        reply = await self._read_message(timeout)
+        if reply.get("id") != message["id"]:
+            raise NodeWorkerError(f"Out-of-order worker reply: {reply}")
+
+        self.jobs_completed += 1
+        return reply
+
+    async def _read_message(self, timeout: float) -> Dict[str, Any]:
+        try:
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise NodeWorkerError(f"Worker did not respond within {timeout}s")
+
+        if not line:
+            raise NodeWorkerError(f"Worker exited: {self.stderr_tail() or 'no output'}")
+
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            raise NodeWorkerError(f"Invalid worker output: {line[:200]!r}")
+
+    async def _drain_stderr(self, process: asyncio.subprocess.Process) -> None:
+        # Keep the pipe flowing and remember the last lines for error reports
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                return
+            self._stderr_tail.append(line.decode(errors="replace").rstrip())
+
+    def stderr_tail(self) -> str:
+        return "\n".join(self._stderr_tail)
+
+class NodeWorkerPool:
+    """A pool of persistent Style Dictionary workers, restarted when they crash or hang"""
+
+    def __init__(self, size: int, script: Path, config_file: Path, cwd: Path):
+        self.size = size
+        # Each worker loads Node, Style Dictionary and the config once, so warm builds skip npx
+        self.workers: List[NodeWorker] = [NodeWorker(script, config_file, cwd) for _ in range(size)]
+        self.available = False
+        self.last_error: Optional[str] = None
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> bool:
+        """Start every worker; returns False (and leaves the pool unavailable) on failure"""
+        try:
+            await asyncio.gather(*(worker.start() for worker in self.workers))
+        except (NodeWorkerError, OSError) as e:
+            self.last_error = str(e)
+            await self.close()
+            return False
+
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+        self.available = True
+        self._health_task = asyncio.create_task(self._health_loop())
+        return True
+
+    async def close(self) -> None:
+        """Stop the health checks and every worker"""
+        self.available = False
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    async def build(
+        self,
+        platform: str,
+        files: Optional[List[str]] = None,
+        build_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build one platform (or only some of its files) on the next idle worker"""
+        message: Dict[str, Any] = {"type": "build", "platform": platform}
+        if files is not None:
+            message["files"] = files
+        if build_path is not None:
+            message["buildPath"] = build_path
+
+        worker = await self._idle.get()
+        try:
+            return await worker.request(
+                message,
+                timeout=settings.NODE_WORKER_BUILD_TIMEOUT
+            )
+        except NodeWorkerError:
+            await self._recover(worker)
+            raise
+        except asyncio.CancelledError:
+            # The job may still be running; don't hand a busy worker to the next caller
+            await self._recover(worker)
+            raise
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def _recover(self, worker: NodeWorker) -> None:
+        try:
+            await worker.restart()
+        except (NodeWorkerError, OSError) as e:
+            self.last_error = str(e)
+            print(f"⚠️  Style Dictionary worker restart failed: {e}")
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.NODE_WORKER_HEALTH_INTERVAL)
+            # Only ping workers that are idle right now; busy ones are clearly alive
+            for _ in range(self._idle.qsize()):
+                worker = self._idle.get_nowait()
+                try:
+                    await worker.request({"type": "ping"}, timeout=settings.NODE_WORKER_PING_TIMEOUT)
+                except NodeWorkerError as e:
+                    print(f"⚠️  Style Dictionary worker unhealthy, restarting: {e}")
+                    await self._recover(worker)
+                finally:
+                    self._idle.put_nowait(worker)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get pool health for the build status endpoint"""
+        return {
+            "available": self.available,
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "workers": [
+                {
+                    "pid": worker.process.pid if worker.alive else None,
+                    "alive": worker.alive,
+                    "jobs_completed": worker.jobs_completed,
+                    "restarts": worker.restarts
+                }
+                for worker in self.workers
+            ],
+            "last_error": self.last_error
+        }
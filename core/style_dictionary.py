@@ -1,13 +1,21 @@
 # Style Dictionary build system integration
 
 import asyncio
+import hashlib
+import json
+import os
 import subprocess
 import time
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from core.config import settings
+from core.artifact_store import ArtifactStore, build_manifest, compress_artifacts, negotiate_encoding
+from core.build_jobs import build_jobs
+from core.build_engine import PythonBuildEngine, platform_files, affected_files
+from core.node_worker import NodeWorkerPool, NodeWorkerError
 
 class StyleDictionaryBuilder:
     """Manages Style Dictionary builds and platform output"""
@@ -16,6 +24,27 @@ class StyleDictionaryBuilder:
         self.config_file = Path("style-dictionary.config.js")
         self.build_cache: Dict[str, Any] = {}
         self.last_build_time: Optional[str] = None
+        self.last_build_duration_ms: Optional[int] = None
+        self.engine = PythonBuildEngine()
+        self.artifacts = ArtifactStore(
+            settings.BUILD_DIR,
+            max_versions=settings.ARTIFACT_MAX_VERSIONS,
+            max_bytes=settings.ARTIFACT_MAX_BYTES
+        )
+        self._style_dictionary_version: Optional[str] = None
+        
+        # Shared by every build so concurrent requests stay within the limit too
+        self.max_concurrent_builds = settings.BUILD_CONCURRENCY or os.cpu_count() or 1
+        self._build_slots = asyncio.Semaphore(self.max_concurrent_builds)
+        
+        # Builds of the same platform take turns so they never share an output directory
+        self._platform_locks: Dict[str, asyncio.Lock] = {}
+        self.node_pool = NodeWorkerPool(
+            settings.NODE_WORKER_POOL_SIZE,
+            script=Path("build-worker.mjs"),
+            config_file=self.config_file,
+            cwd=Path.cwd()
+        )
         
     async def setup_style_dictionary(self) -> None:
         """Initialize Style Dictionary configuration"""
@@ -31,60 +60,289 @@ class StyleDictionaryBuilder:
         except Exception as e:
             print(f"⚠️  Could not check Style Dictionary installation: {e}")
         
+        # Start persistent build workers; builds fall back to npx without them
+        if settings.NODE_WORKER_POOL_SIZE > 0:
+            if await self.node_pool.start():
+                print(f"✅ Started {self.node_pool.size} Style Dictionary build worker(s)")
+            else:
+                print(f"⚠️  Style Dictionary workers unavailable, using npx: {self.node_pool.last_error}")
+        
         print("✅ Style Dictionary setup complete")
     
-    async def build_platforms(self, platforms: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
-        """Build tokens for specified platforms"""
+    async def shutdown(self) -> None:
+        """Stop background build workers"""
+        await self.node_pool.close()
+    
+    async def build_platforms(self, platforms: Optional[List[str]] = None, force_rebuild: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Build tokens for specified platforms, reusing cached output where possible"""
+        # Import here to avoid circular import
+        from core.token_manager import token_manager
+        
         if platforms is None:
             platforms = settings.PLATFORMS + ['scss', 'json']
         
-        results = {}
         build_start = time.time()
+        tokens_version, token_hash = await token_manager.get_document_state()
+        config_hash = await asyncio.to_thread(self._config_hash)
         
-        for platform in platforms:
-            build_result = await self._build_single_platform(platform)
-            results[platform] = build_result
+        # Platforms build concurrently; wall-clock time tracks the slowest one
+        build_results = await asyncio.gather(*(
+            self._build_exclusive(platform, tokens_version, token_hash, config_hash, force_rebuild)
+            for platform in platforms
+        ))
+        results = dict(zip(platforms, build_results))
         
         # Update build cache and time
+        total_time = int((time.time() - build_start) * 1000)
         self.last_build_time = datetime.now().isoformat()
+        self.last_build_duration_ms = total_time
         self.build_cache.update(results)
         
-        total_time = int((time.time() - build_start) * 1000)
-        print(f"🏗️  Build completed in {total_time}ms for platforms: {', '.join(platforms)}")
+        cached = [platform for platform, result in results.items() if result.get("cached")]
+        skipped = [platform for platform, result in results.items() if result.get("skipped")]
+        notes = []
+        if cached:
+            notes.append(f"{len(cached)} from cache")
+        if skipped:
+            notes.append(f"{len(skipped)} unaffected")
+        print(f"🏗️  Build completed in {total_time}ms for platforms: {', '.join(platforms)}"
+              + (f" ({', '.join(notes)})" if notes else ""))
         
         return results
     
-    async def _build_single_platform(self, platform: str) -> Dict[str, Any]:
-        """Build tokens for a single platform"""
+    async def _build_exclusive(self, platform: str, *args: Any) -> Dict[str, Any]:
+        """Build a platform while holding its lock; a waiting duplicate then hits the cache"""
+        async with self._platform_locks.setdefault(platform, asyncio.Lock()):
+            return await self._build_cached(platform, *args)
+    
+    async def _build_cached(
+        self,
+        platform: str,
+        tokens_version: int,
+        token_hash: str,
+        config_hash: str,
+        force_rebuild: bool
+    ) -> Dict[str, Any]:
+        """Publish a stored version of a platform, or build what changed into a new one"""
+        # Import here to avoid circular import
+        from core.token_manager import token_manager
+        
+        builder_version = await self._builder_version(platform)
+        key = self.artifacts.make_key(token_hash, config_hash, platform, builder_version)
+        # A forced rebuild is stored as a new version; the old one stays intact for its readers
+        version_key = key
+        if force_rebuild:
+            version_key = self.artifacts.make_key(token_hash, config_hash, platform, builder_version, uuid.uuid4().hex)
+        
+        if not force_rebuild:
+            lookup_start = time.time()
+            entry = await asyncio.to_thread(self.artifacts.lookup, platform, key)
+            if entry is not None:
+                if self.artifacts.current_key(platform) != entry["version_key"]:
+                    await asyncio.to_thread(self.artifacts.publish, platform, entry["version_key"])
+                
+                return {
+                    **entry,
+                    "cached": True,
+                    "cache_key": key,
+                    "skipped": False,
+                    "skipped_files": [],
+                    "build_duration_ms": int((time.time() - lookup_start) * 1000),
+                    "queue_wait_ms": 0
+                }
+        
+        plan = None
+        if not force_rebuild:
+            plan = await self._plan_incremental(platform, config_hash, builder_version)
+        
+        # Unaffected files are carried over from the previous version
+        output_dir = await asyncio.to_thread(
+            self.artifacts.create_staging, platform, plan["previous_key"] if plan else None
+        )
+        
+        try:
+            if plan is not None and not plan["files"]:
+                # None of this platform's files can contain a changed token; keep the last build
+                result = {
+                    **plan["previous"],
+                    "build_time": datetime.now().isoformat(),
+                    "build_duration_ms": 0,
+                    "queue_wait_ms": 0
+                }
+            else:
+                result = await self._build_with_limits(platform, output_dir, plan["files"] if plan else None)
+            
+            result.update({
+                "cached": False,
+                "cache_key": key,
+                "version_key": version_key,
+                "skipped": plan is not None and not plan["files"],
+                "skipped_files": plan["skipped_files"] if plan else [],
+                "tokens_version": tokens_version,
+                "token_hash": token_hash,
+                "config_hash": config_hash,
+                "builder_version": builder_version
+            })
+            
+            # Tokens edited mid-build would make the output disagree with its key
+            if result["success"] and await token_manager.get_tokens_hash() != token_hash:
+                result["success"] = False
+                result["error"] = "Tokens changed during the build; output discarded, build again"
+        except BaseException:
+            await asyncio.to_thread(self.artifacts.discard, output_dir)
+            raise
+        
+        if result["success"]:
+            # Compress and index once here so downloads and listings never have to
+            await asyncio.to_thread(
+                compress_artifacts, output_dir,
+                settings.ARTIFACT_COMPRESSION, settings.ARTIFACT_COMPRESSION_MIN_BYTES
+            )
+            manifest = await asyncio.to_thread(build_manifest, output_dir)
+            result["output_files"] = [file["path"] for file in manifest["files"]]
+            result["file_sizes"] = {file["path"]: file["size"] for file in manifest["files"]}
+            await asyncio.to_thread(self.artifacts.commit, platform, version_key, output_dir, result, manifest)
+            await asyncio.to_thread(self.artifacts.publish, platform, version_key)
+            await asyncio.to_thread(self.artifacts.evict, platform)
+        else:
+            await asyncio.to_thread(self.artifacts.discard, output_dir)
+        
+        return result
+    
+    async def _plan_incremental(self, platform: str, config_hash: str, builder_version: str) -> Optional[Dict[str, Any]]:
+        """Work out which published files token changes can affect; None means build in full"""
+        # Import here to avoid circular import
+        from core.token_manager import token_manager
+        
+        files = [file["destination"] for file in platform_files(platform)]
+        previous_key = self.artifacts.current_key(platform)
+        if not files or previous_key is None:
+            return None
+        
+        previous = await asyncio.to_thread(self.artifacts.read_entry, platform, previous_key)
+        if (
+            previous is None
+            or not previous.get("success")
+            or previous.get("config_hash") != config_hash
+            or previous.get("builder_version") != builder_version
+            or "tokens_version" not in previous
+            or "token_hash" not in previous
+        ):
+            return None
+        
+        changes = await token_manager.get_changes_since(previous["tokens_version"], previous["token_hash"])
+        if changes is None:
+            return None
+        
+        affected = affected_files(platform, changes["token_types"])
+        if len(affected) == len(files):
+            return None
+        
+        # npx always builds every file; only the in-process engine and the workers can subset
+        if affected and not (self._uses_native_engine(platform) or self.node_pool.available):
+            return None
+        
+        return {
+            "previous": previous,
+            "previous_key": previous_key,
+            "files": affected,
+            "skipped_files": [name for name in files if name not in affected]
+        }
+    
+    def _config_hash(self) -> str:
+        """Hash the Style Dictionary config, which decides every platform's output"""
+        try:
+            return hashlib.sha256(self.config_file.read_bytes()).hexdigest()
+        except OSError:
+            return ""
+    
+    async def _builder_version(self, platform: str) -> str:
+        """Get the name and version of the engine that builds a platform"""
+        if self._uses_native_engine(platform):
+            return f"python-{self.engine.VERSION}"
+        
+        if self._style_dictionary_version is None:
+            self._style_dictionary_version = await asyncio.to_thread(self._read_style_dictionary_version)
+        return f"style-dictionary-{self._style_dictionary_version}"
+    
+    def _read_style_dictionary_version(self) -> str:
+        """Read the installed Style Dictionary version, or the declared range if not installed"""
+        try:
+            with open(Path("node_modules/style-dictionary/package.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)["version"]
+        except (OSError, KeyError, json.JSONDecodeError):
+            pass
+        
+        try:
+            with open(Path("package.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)["dependencies"]["style-dictionary"]
+        except (OSError, KeyError, json.JSONDecodeError):
+            return "unknown"
+    
+    async def _build_with_limits(
+        self,
+        platform: str,
+        output_dir: Path,
+        files: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Build one platform within the concurrency limit and the per-platform timeout"""
+        queued_at = time.time()
+        
+        async with self._build_slots:
+            queue_wait = int((time.time() - queued_at) * 1000)
+            build_start = time.time()
+            
+            try:
+                result = await asyncio.wait_for(
+                    self._build_single_platform(platform, output_dir, files),
+                    timeout=settings.BUILD_PLATFORM_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                # wait_for cancelled the build, which kills its subprocess or worker job
+                result = {
+                    "success": False,
+                    "platform": platform,
+                    "build_time": datetime.now().isoformat(),
+                    "output_files": [],
+                    "file_sizes": {},
+                    "build_duration_ms": int((time.time() - build_start) * 1000),
+                    "error": f"Build timed out after {settings.BUILD_PLATFORM_TIMEOUT}s"
+                }
+        
+        result["queue_wait_ms"] = queue_wait
+        return result
+    
+    def _uses_native_engine(self, platform: str) -> bool:
+        """Check whether a platform is built in-process instead of by Style Dictionary"""
+        return platform in settings.NATIVE_BUILD_PLATFORMS and self.engine.supports(platform)
+    
+    async def _build_single_platform(
+        self,
+        platform: str,
+        output_dir: Path,
+        files: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Build tokens for a single platform (or only the given files) into output_dir"""
+        if self._uses_native_engine(platform):
+            return await self._build_native_platform(platform, output_dir, files)
+        
         build_start = time.time()
         
         try:
             # Run Style Dictionary build
-            result = await self._run_command([
-                "npx", "style-dictionary", "build", "--config", "style-dictionary.config.js", "--platform", platform
-            ])
+            result = await self._run_style_dictionary(platform, output_dir, files)
             
             build_duration = int((time.time() - build_start) * 1000)
             
             if result.returncode == 0:
-                # Collect output files
-                platform_dir = settings.BUILD_DIR / platform
-                output_files = []
-                file_sizes = {}
-                
-                if platform_dir.exists():
-                    for file_path in platform_dir.rglob('*'):
-                        if file_path.is_file():
-                            relative_path = str(file_path.relative_to(platform_dir))
-                            output_files.append(relative_path)
-                            file_sizes[relative_path] = file_path.stat().st_size
-                
+                # Output files are listed from the manifest once the build is sealed
                 return {
                     "success": True,
                     "platform": platform,
+                    "engine": "style-dictionary",
                     "build_time": datetime.now().isoformat(),
-                    "output_files": output_files,
-                    "file_sizes": file_sizes,
+                    "output_files": [],
+                    "file_sizes": {},
                     "build_duration_ms": build_duration,
                     "error": None
                 }
@@ -111,6 +369,46 @@ class StyleDictionaryBuilder:
                 "error": str(e)
             }
     
+    async def _build_native_platform(
+        self,
+        platform: str,
+        output_dir: Path,
+        files: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Emit a platform's files straight from the resident token document"""
+        # Import here to avoid circular import
+        from core.token_manager import token_manager
+        
+        build_start = time.time()
+        
+        try:
+            # Resolve on the event loop (memoized), write in a worker thread
+            tokens = await token_manager.get_build_tokens()
+            await asyncio.to_thread(self.engine.build_platform, platform, tokens, output_dir, files)
+            output_files = [file["destination"] for file in platform_files(platform)]
+            
+            return {
+                "success": True,
+                "platform": platform,
+                "engine": "python",
+                "build_time": datetime.now().isoformat(),
+                "output_files": output_files,
+                "file_sizes": {name: (output_dir / name).stat().st_size for name in output_files},
+                "build_duration_ms": int((time.time() - build_start) * 1000),
+                "error": None
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "platform": platform,
+                "engine": "python",
+                "build_time": datetime.now().isoformat(),
+                "output_files": [],
+                "file_sizes": {},
+                "build_duration_ms": int((time.time() - build_start) * 1000),
+                "error": str(e)
+            }
+    
     def get_build_status(self) -> Dict[str, Any]:
         """Get current build status"""
         available_platforms = settings.PLATFORMS + ['scss', 'json']
@@ -118,48 +416,64 @@ class StyleDictionaryBuilder:
         return {
             "available_platforms": available_platforms,
             "last_build_time": self.last_build_time,
+            "last_build_duration_ms": self.last_build_duration_ms,
+            "max_concurrent_builds": self.max_concurrent_builds,
             "build_cache": self.build_cache,
+            "artifacts": self.artifacts.get_stats(),
             "config_file_exists": self.config_file.exists(),
+            "node_workers": self.node_pool.get_status(),
+            "auto_build": self._auto_build_status(),
+            "build_jobs": build_jobs.get_status(),
             "build_dir_exists": settings.BUILD_DIR.exists()
         }
     
-    def get_platform_files(self, platform: str) -> List[Dict[str, Any]]:
-        """Get list of files for a specific platform"""
-        platform_dir = settings.BUILD_DIR / platform
-        files = []
-        
-        if not platform_dir.exists():
-            return files
-        
-        for file_path in platform_dir.rglob('*'):
-            if file_path.is_file():
-                relative_path = str(file_path.relative_to(platform_dir))
-                stat = file_path.stat()
-                
-                files.append({
-                    "name": file_path.name,
-                    "path": relative_path,
-                    "size": stat.st_size,
-                    "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                    "extension": file_path.suffix
-                })
-        
-        # Sort by modification time (newest first)
-        files.sort(key=lambda x: x["modified"], reverse=True)
-        return files
-    
-    def get_file_content(self, platform: str, filename: str) -> str:
-        """Get the content of a specific build file"""
-        file_path = settings.BUILD_DIR / platform / filename
+    def _auto_build_status(self) -> Dict[str, Any]:
+        # Import here to avoid circular import
+        from core.build_scheduler import build_scheduler
+        return build_scheduler.get_status()
+    
+    def get_platform_manifest(self, platform: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get the manifest (files, sizes, hashes, totals) of the published or a pinned version"""
+        return self.artifacts.manifest(platform, version)
+    
+    def get_platform_files(self, platform: str, version: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get list of files for a specific platform (published version unless pinned)"""
+        manifest = self.artifacts.manifest(platform, version)
+        return manifest["files"] if manifest else []
+    
+    def _manifest_entry(self, platform: str, filename: str, version: Optional[str]) -> Tuple[Path, Dict[str, Any]]:
+        manifest = self.artifacts.manifest(platform, version)
+        if manifest is None:
+            if version is not None:
+                raise FileNotFoundError(f"Version '{version}' not found for platform '{platform}'")
+            raise FileNotFoundError(f"No build published for platform '{platform}'")
         
-        if not file_path.exists():
+        # Only files listed in the manifest are served, which also rules out path traversal
+        entry = manifest["index"].get(filename)
+        if entry is None:
             raise FileNotFoundError(f"File '{filename}' not found for platform '{platform}'")
         
-        # Security check - ensure file is within platform directory
-        try:
-            file_path.resolve().relative_to(settings.BUILD_DIR / platform)
-        except ValueError:
-            raise ValueError("Access denied - file outside platform directory")
+        return self.artifacts.version_dir(platform, manifest["version"]) / "files" / entry["path"], entry
+    
+    def get_artifact_path(self, platform: str, filename: str, version: Optional[str] = None) -> Path:
+        """Get the path of a build file in the published (or a pinned) version"""
+        return self._manifest_entry(platform, filename, version)[0]
+    
+    def get_encoded_artifact(
+        self,
+        platform: str,
+        filename: str,
+        version: Optional[str] = None,
+        accept_encoding: Optional[str] = None
+    ) -> Tuple[Path, Optional[str], Dict[str, Any]]:
+        """Get a build file or its precompressed variant, the Content-Encoding to send and its manifest entry"""
+        file_path, entry = self._manifest_entry(platform, filename, version)
+        path, encoding = negotiate_encoding(file_path, accept_encoding, entry["encodings"])
+        return path, encoding, entry
+    
+    def get_file_content(self, platform: str, filename: str, version: Optional[str] = None) -> str:
+        """Get the content of a specific build file"""
+        file_path = self.get_artifact_path(platform, filename, version)
         
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -167,10 +481,20 @@ class StyleDictionaryBuilder:
         except UnicodeDecodeError:
             raise ValueError("File is not text-readable")
     
+    def get_platform_versions(self, platform: str) -> List[Dict[str, Any]]:
+        """Get the retained build versions of a platform"""
+        return self.artifacts.list_versions(platform)
+    
+    def clear_platform_build(self, platform: str) -> None:
+        """Unpublish one platform's build; its stored versions stay available"""
+        self.artifacts.unpublish(platform)
+        self.build_cache.pop(platform, None)
+    
     def clear_build_cache(self) -> None:
         """Clear all build files and cache"""
         import shutil
         
+        self.artifacts.clear()
         if settings.BUILD_DIR.exists():
             shutil.rmtree(settings.BUILD_DIR)
             settings.BUILD_DIR.mkdir(exist_ok=True)
@@ -180,6 +504,53 @@ class StyleDictionaryBuilder:
         
         print("🧹 Build cache cleared")
     
+    async def _run_style_dictionary(
+        self,
+        platform: str,
+        output_dir: Path,
+        files: Optional[List[str]] = None
+    ) -> subprocess.CompletedProcess:
+        """Build a platform into output_dir on a persistent worker, or with npx if no worker is available"""
+        build_path = f"{output_dir}{os.sep}"
+        
+        if self.node_pool.available:
+            try:
+                reply = await self.node_pool.build(platform, files, build_path=build_path)
+                return subprocess.CompletedProcess(
+                    args=["build-worker", platform],
+                    returncode=0 if reply.get("ok") else 1,
+                    stdout=b"",
+                    stderr=(reply.get("error") or "").encode()
+                )
+            except NodeWorkerError as e:
+                print(f"⚠️  Build worker failed for {platform}, falling back to npx: {e}")
+        
+        config_path = await asyncio.to_thread(self._write_build_config, platform, build_path, output_dir.parent)
+        try:
+            return await self._run_command([
+                "npx", "style-dictionary", "build", "--config", str(config_path), "--platform", platform
+            ])
+        finally:
+            config_path.unlink(missing_ok=True)
+    
+    def _write_build_config(self, platform: str, build_path: str, directory: Path) -> Path:
+        """Write a config that extends the project config with a platform's buildPath redirected"""
+        config_path = directory / f".style-dictionary-{platform}.config.js"
+        source = (
+            "// Generated for one build; see core/style_dictionary.py\n"
+            f"const config = require({json.dumps(str(self.config_file.resolve()))});\n"
+            f"const platform = {json.dumps(platform)};\n"
+            "module.exports = {\n"
+            "  ...config,\n"
+            "  platforms: {\n"
+            "    ...config.platforms,\n"
+            f"    [platform]: {{ ...config.platforms[platform], buildPath: {json.dumps(build_path)} }}\n"
+            "  }\n"
+            "};\n"
+        )
+        config_path.write_text(source, encoding='utf-8')
+        return config_path
+    
     async def _run_command(self, command: List[str]) -> subprocess.CompletedProcess:
         """Run a command asynchronously"""
         process = await asyncio.create_subprocess_exec(
@@ -189,7 +560,14 @@ class StyleDictionaryBuilder:
             cwd=Path.cwd()
         )
         
-        stdout, stderr = await process.communicate()
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # Timed out or abandoned; don't leave the build running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
         
         return subprocess.CompletedProcess(
             args=command,
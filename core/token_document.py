@@ -0,0 +1,101 @@
+# Immutable token document helpers
+
+import json
+import hashlib
+from typing import Any, Dict, List
+
+class FrozenDict(dict):
+    """Read-only dict used for token document snapshots"""
+
+    # Merkle hash of this node, filled in lazily by node_hash()
+    __slots__ = ("_merkle_hash",)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Token snapshots are read-only")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(value: Any) -> Any:
+    """Recursively convert a JSON value into read-only containers"""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(child)) for key, child in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(child) for child in value)
+    return value
+
+def thaw(value: Any) -> Any:
+    """Recursively convert a frozen value back into plain, mutable JSON containers"""
+    if isinstance(value, dict):
+        return {key: thaw(child) for key, child in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(child) for child in value]
+    return value
+
+_DELETE = object()
+
+def replace_path(document: Dict[str, Any], path_parts: List[str], node: Any = _DELETE) -> FrozenDict:
+    """Return a new document with `node` stored at `path_parts` (or removed when no node is given)"""
+    # Only ancestors of the path are copied; untouched subtrees are shared with the original
+    head, rest = path_parts[0], path_parts[1:]
+    items = dict(document)
+
+    if rest:
+        child = document.get(head)
+        items[head] = replace_path(child if isinstance(child, dict) else FrozenDict(), rest, node)
+    elif node is _DELETE:
+        items.pop(head, None)
+    else:
+        items[head] = freeze(node)
+
+    return FrozenDict(items)
+
+def node_hash(node: Any) -> str:
+    """Merkle hash of a token, group or plain value"""
+    # Cached on frozen nodes; writes copy only ancestors, so only those get rehashed
+    if isinstance(node, FrozenDict):
+        try:
+            return node._merkle_hash
+        except AttributeError:
+            pass
+
+    if isinstance(node, dict) and "$value" not in node:
+        # A group covers its keys and its children's hashes
+        digest = hashlib.md5()
+        for key in sorted(node):
+            digest.update(json.dumps(key).encode())
+            digest.update(node_hash(node[key]).encode())
+        result = digest.hexdigest()
+    else:
+        # Tokens and plain values are leaves
+        result = hashlib.md5(json.dumps(node, sort_keys=True).encode()).hexdigest()
+
+    if isinstance(node, FrozenDict):
+        node._merkle_hash = result
+    return result
+
+def document_hash(document: Dict[str, Any]) -> str:
+    """Merkle root of a token document, ignoring top-level $schema/$metadata entries"""
+    digest = hashlib.md5()
+    for key in sorted(document):
+        if not key.startswith("$"):
+            digest.update(json.dumps(key).encode())
+            digest.update(node_hash(document[key]).encode())
+    return digest.hexdigest()
@@ -0,0 +1,97 @@
+# Flat path index over the resident token document
+
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional
+
+class TokenIndex:
+    """Maps dotted paths to token and group nodes, with sorted paths for prefix queries"""
+
+    def __init__(self, document: Optional[Dict[str, Any]] = None):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.paths: List[str] = []
+
+        if document is not None:
+            self.rebuild(document)
+
+    def rebuild(self, document: Dict[str, Any]) -> None:
+        """Index every node of a document from scratch"""
+        self.nodes = {}
+        self._collect(document, "", self.nodes)
+        self.paths = sorted(self.nodes)
+
+    def get(self, token_path: str) -> Optional[Dict[str, Any]]:
+        """Get the token or group node stored at a path"""
+        return self.nodes.get(token_path)
+
+    def is_token(self, token_path: str) -> bool:
+        """Check whether a path holds a token (rather than a group)"""
+        node = self.nodes.get(token_path)
+        return node is not None and "$value" in node
+
+    def paths_under(self, prefix: str) -> List[str]:
+        """Get all indexed paths strictly below a prefix, in sorted order"""
+        if not prefix:
+            return list(self.paths)
+        lo, hi = self._descendant_range(prefix)
+        return self.paths[lo:hi]
+
+    def tokens_under(self, prefix: str = "") -> Dict[str, Dict[str, Any]]:
+        """Get every token at or below a prefix as a flat {path: token} mapping"""
+        candidates = self.paths_under(prefix)
+        if prefix in self.nodes:
+            candidates = [prefix] + candidates
+
+        return {
+            path: self.nodes[path]
+            for path in candidates
+            if "$value" in self.nodes[path]
+        }
+
+    def update_path(self, document: Dict[str, Any], token_path: str) -> None:
+        """Re-index a single path after it was replaced or removed in `document`"""
+        # Drop the stale entries for the path and everything below it
+        if self.nodes.pop(token_path, None) is not None:
+            del self.paths[bisect_left(self.paths, token_path)]
+        lo, hi = self._descendant_range(token_path)
+        for path in self.paths[lo:hi]:
+            del self.nodes[path]
+        del self.paths[lo:hi]
+
+        # Ancestors were copied by the write, so point them at the new nodes
+        path_parts = token_path.split('.')
+        current = document
+        for depth, part in enumerate(path_parts, start=1):
+            current = current.get(part) if isinstance(current, dict) else None
+            if not isinstance(current, dict):
+                return
+
+            path = '.'.join(path_parts[:depth])
+            if depth < len(path_parts):
+                self._set(path, current)
+
+        # Index the new subtree
+        subtree: Dict[str, Dict[str, Any]] = {token_path: current}
+        self._collect(current, token_path, subtree)
+        for path, node in subtree.items():
+            self._set(path, node)
+
+    def _set(self, path: str, node: Dict[str, Any]) -> None:
+        if path not in self.nodes:
+            insort(self.paths, path)
+        self.nodes[path] = node
+
+    def _descendant_range(self, prefix: str):
+        # '/' sorts directly after '.', so this brackets exactly the "prefix." keys
+        return (
+            bisect_left(self.paths, prefix + '.'),
+            bisect_left(self.paths, prefix + '/')
+        )
+
+    @classmethod
+    def _collect(cls, node: Dict[str, Any], prefix: str, out: Dict[str, Dict[str, Any]]) -> None:
+        for key, child in node.items():
+            if key.startswith('$') or not isinstance(child, dict):
+                continue
+            path = f"{prefix}.{key}" if prefix else key
+            out[path] = child
+            cls._collect(child, path, out)
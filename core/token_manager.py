@@ -1,116 +1,371 @@
 import json
-import hashlib
+import time
 import asyncio
+from collections import ChainMap, deque
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Callable, Deque, FrozenSet, Set
 
 from fastapi import HTTPException
 
 from core.config import settings
+from core.fileutil import atomic_write
+from core.token_document import FrozenDict, freeze, thaw, replace_path, node_hash, document_hash
+from core.token_index import TokenIndex
+from core.token_resolver import TokenResolver, find_references
+
+# A mutation takes the current document and returns (new document, touched paths, result)
+Mutation = Callable[[FrozenDict], Tuple[FrozenDict, List[str], Any]]
 
 class TokenManager:
     """Manages design token storage and updates"""
     
     def __init__(self):
         self.tokens_file = settings.TOKENS_DIR / "tokens.json"
-        self.build_cache = {}
+        
+        # Resident, authoritative copy of tokens.json. Documents are never mutated
+        # in place, so every reader holds a consistent snapshot.
+        self._document: Optional[FrozenDict] = None
+        self._file_signature: Optional[Tuple[int, int, int]] = None
+        
+        # Flat path -> node index kept in step with the resident document
+        self._index = TokenIndex()
+        
+        # Reference graph and memoized resolved values, plus the resolved view of
+        # the whole document for the current version
+        self._resolver = TokenResolver(self._index)
+        self._resolved_document: Optional[FrozenDict] = None
+        
+        # Writers are serialized; the file itself is written off the event loop
+        self._write_lock = asyncio.Lock()
+        self._writing = False
+        self.write_stats: Dict[str, Any] = {
+            "writes": 0,
+            "total_ms": 0.0,
+            "last_ms": None,
+            "max_ms": 0.0,
+            "last_bytes": None,
+            "last_group_size": None
+        }
+        
+        # Group commit: queued mutations are applied and written together
+        self._pending: List[Tuple[Mutation, asyncio.Future]] = []
+        self._batch_ready = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # While a group is applied: references written by its earlier mutations, so
+        # cycle checks see edges that are not in the resolver graph yet
+        self._pending_references: Optional[ChainMap] = None
+        
+        # Per-path revisions for optimistic concurrency. subtree revisions are bumped
+        # for a touched path and all its ancestors; node revisions only for the exact
+        # path replaced. Paths without an entry were last changed at the base revision.
+        self._base_revision = 0
+        self._subtree_revisions: Dict[str, int] = {}
+        self._node_revisions: Dict[str, int] = {}
+        
+        # (version, tokens hash, affected token paths, affected token types) per commit,
+        # so builds can tell what changed since the version they were made from. The base
+        # is the (version, hash) the log starts from; it is reset whenever the file is
+        # reloaded, since an outside edit usually leaves the version number unchanged.
+        self._change_log: Deque[Tuple[int, str, FrozenSet[str], FrozenSet[Optional[str]]]] = deque(
+            maxlen=settings.TOKEN_CHANGE_LOG_SIZE
+        )
+        self._change_log_base: Optional[Tuple[int, str]] = None
+    
+    def _read_file_signature(self) -> Optional[Tuple[int, int, int]]:
+        """Get the (mtime, size, inode) signature of the tokens file"""
+        try:
+            stat = self.tokens_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _refresh_document(self) -> Optional[FrozenDict]:
+        """Reload the resident document only if the tokens file changed on disk"""
+        # Our own write is replacing the file; the resident document is already newer
+        if self._writing and self._document is not None:
+            return self._document
+        
+        signature = self._read_file_signature()
+        if signature is None:
+            return None
+        
+        if self._document is None or signature != self._file_signature:
+            try:
+                with open(self.tokens_file, 'r', encoding='utf-8') as f:
+                    document = freeze(json.load(f))
+            except (json.JSONDecodeError, IOError) as e:
+                raise HTTPException(
+                    status_code=500, 
+                    detail=f"Failed to load tokens: {str(e)}"
+                )
+            
+            self._document = document
+            self._file_signature = signature
+            self._index.rebuild(document)
+            self._resolver.rebuild()
+            self._resolved_document = None
+            self._reset_revisions(document)
+            # Edited outside the API: what changed is unknown
+            self._change_log.clear()
+            self._change_log_base = (
+                (document.get("$metadata") or {}).get("version", 0),
+                document_hash(document)
+            )
+            print(f"📄 Tokens loaded from {self.tokens_file}")
+        
+        return self._document
     
     async def load_tokens(self) -> Dict[str, Any]:
-        """Load tokens from JSON file"""
-        if not self.tokens_file.exists():
+        """Get a read-only snapshot of the token document"""
+        document = self._refresh_document()
+        if document is None:
             # Create default tokens if file doesn't exist
-            default_tokens = self._create_default_tokens()
-            await self.save_tokens(default_tokens, notify_clients=False)
-            return default_tokens
+            await self.save_tokens(self._create_default_tokens(), notify_clients=False)
+            return self._document
         
-        try:
-            with open(self.tokens_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Failed to load tokens: {str(e)}"
-            )
+        return document
     
     async def save_tokens(self, tokens: Dict[str, Any], notify_clients: bool = True) -> None:
-        """Save tokens to JSON file and notify clients via all channels"""
-        # Load previous tokens to detect changes
-        old_tokens = {}
-        if self.tokens_file.exists() and notify_clients:
-            try:
-                with open(self.tokens_file, 'r', encoding='utf-8') as f:
-                    old_tokens = json.load(f)
-            except Exception:
-                pass  # If we can't load old tokens, treat everything as new
+        """Save a complete token document and notify clients via all channels"""
+        # Work on a private copy so snapshots passed in by callers stay untouched
+        async with self._write_lock:
+            await self._commit(freeze(tokens), notify_clients=notify_clients)
+    
+    async def _commit(
+        self,
+        tokens: FrozenDict,
+        touched_paths: Optional[List[str]] = None,
+        notify_clients: bool = True
+    ) -> FrozenDict:
+        """Stamp metadata on a new document, write it to disk and make it resident"""
+        # touched_paths lets the index update incrementally; without it the index is rebuilt
+        old_tokens = self._document
         
         # Add metadata
-        if "$metadata" not in tokens:
-            tokens["$metadata"] = {}
-        
-        tokens["$metadata"]["modified"] = datetime.now().isoformat()
-        tokens["$metadata"]["version"] = tokens["$metadata"].get("version", 0) + 1
+        metadata = thaw(tokens.get("$metadata") or {})
+        metadata["modified"] = datetime.now().isoformat()
+        metadata["version"] = metadata.get("version", 0) + 1
         
         # Calculate hash for change detection
         tokens_hash = self._calculate_tokens_hash(tokens)
-        tokens["$metadata"]["hash"] = tokens_hash
+        metadata["hash"] = tokens_hash
+        tokens = replace_path(tokens, ["$metadata"], metadata)
         
-        # Write to file
+        # Serialize and write off the event loop
+        self._writing = True
         try:
-            with open(self.tokens_file, 'w', encoding='utf-8') as f:
-                json.dump(tokens, f, indent=2, ensure_ascii=False)
-        except IOError as e:
+            self._file_signature = await asyncio.to_thread(self._write_file, tokens)
+        except (IOError, OSError) as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to save tokens: {str(e)}"
             )
+        finally:
+            self._writing = False
         
-        # Detect changes and notify clients via all channels
-        if old_tokens and notify_clients:
-            changed_paths, new_values = self._detect_token_changes(old_tokens, tokens)
-            if changed_paths:
-                # Import here to avoid circular import
-                from core.update_broadcaster import broadcaster
-                await broadcaster.broadcast_token_update(changed_paths, new_values, tokens_hash)
-        
-        # Invalidate build cache
-        self.build_cache.clear()
-        print(f"💾 Tokens saved to {self.tokens_file} (v{tokens['$metadata']['version']})")
-    
-    def _detect_token_changes(self, old_tokens: Dict[str, Any], new_tokens: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
-        """Detect which tokens have changed between versions"""
-        changed_paths = []
-        new_values = {}
-        
-        def compare_tokens(old_obj: Any, new_obj: Any, current_path: str = ""):
-            if isinstance(new_obj, dict):
-                if "$value" in new_obj:
-                    # This is a token - compare values
-                    old_value = None
-                    if isinstance(old_obj, dict) and "$value" in old_obj:
-                        old_value = old_obj["$value"]
-                    
-                    # Check if value changed
-                    if old_value != new_obj["$value"]:
-                        changed_paths.append(current_path)
-                        new_values[current_path] = new_obj
-                        print(f"🔄 Token changed: {current_path} = {new_obj['$value']}")
-                else:
-                    # Recurse into nested objects
-                    for key, value in new_obj.items():
-                        if not key.startswith("$"):  # Skip metadata
-                            new_path = f"{current_path}.{key}" if current_path else key
-                            old_child = old_obj.get(key, {}) if isinstance(old_obj, dict) else {}
-                            compare_tokens(old_child, value, new_path)
+        self._document = tokens
+        
+        # Build the change set from the paths the mutations touched; only a full
+        # document save has to compare every token
+        if touched_paths is None:
+            before = self._index.tokens_under() if old_tokens else {}
+            self._index.rebuild(tokens)
+            self._resolver.rebuild()
+            self._reset_revisions(tokens)
+            changes = self._diff_tokens(before, self._index.tokens_under())
+            changed = {change["path"] for change in changes}
+            affected = changed | self._resolver.transitive_dependents(changed)
+        else:
+            roots = self._change_roots(touched_paths)
+            before = {}
+            for token_path in roots:
+                before.update(self._index.tokens_under(token_path))
+            after = {}
+            for token_path in roots:
+                self._index.update_path(tokens, token_path)
+                after.update(self._index.tokens_under(token_path))
+            changes = self._diff_tokens(before, after)
+            affected = self._resolver.update(change["path"] for change in changes)
+        self._resolved_document = None
+        self._record_changes(metadata["version"], tokens_hash, changes, before, affected)
+        
+        # Notify clients via all channels
+        if old_tokens and notify_clients and changes:
+            changed_paths = [change["path"] for change in changes]
+            new_values = {
+                change["path"]: change["value"]
+                for change in changes
+                if change["type"] != "removed"
+            }
+            
+            # Tokens that reference a changed token move with it; send their new
+            # resolved values so clients don't have to refetch the document
+            dependent_paths = sorted(affected.difference(changed_paths))
+            resolved_values = {
+                token_path: self._resolver.resolve(token_path)
+                for token_path in list(new_values) + dependent_paths
+                if self._index.is_token(token_path)
+            }
+            
+            # Import here to avoid circular import
+            from core.update_broadcaster import broadcaster
+            await broadcaster.broadcast_token_update(
+                changed_paths,
+                new_values,
+                tokens_hash,
+                changes,
+                dependent_paths=dependent_paths,
+                resolved_values=resolved_values
+            )
+        
+        if settings.AUTO_BUILD_ENABLED and changes:
+            # Import here to avoid circular import
+            from core.build_scheduler import build_scheduler
+            build_scheduler.notify(metadata["version"])
+        
+        print(f"💾 Tokens saved to {self.tokens_file} (v{metadata['version']})")
+        
+        return tokens
+    
+    def _write_file(self, tokens: FrozenDict) -> Optional[Tuple[int, int, int]]:
+        """Atomically replace the tokens file and return its new signature; runs in a worker thread"""
+        write_start = time.perf_counter()
+        
+        data = json.dumps(tokens, indent=2, ensure_ascii=False).encode('utf-8')
+        
+        # Fsynced before and after the rename, so a crash leaves the old or new file, never a torn one
+        atomic_write(self.tokens_file, [data], fsync=True)
+        
+        self._record_write(time.perf_counter() - write_start, len(data))
+        return self._read_file_signature()
+    
+    def _record_write(self, duration: float, size: int) -> None:
+        """Track write latency for get_write_stats"""
+        duration_ms = duration * 1000
+        stats = self.write_stats
+        stats["writes"] += 1
+        stats["total_ms"] += duration_ms
+        stats["last_ms"] = round(duration_ms, 3)
+        stats["max_ms"] = round(max(stats["max_ms"], duration_ms), 3)
+        stats["last_bytes"] = size
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """Get token file write latency statistics"""
+        stats = self.write_stats
+        return {
+            "writes": stats["writes"],
+            "last_ms": stats["last_ms"],
+            "avg_ms": round(stats["total_ms"] / stats["writes"], 3) if stats["writes"] else None,
+            "max_ms": stats["max_ms"],
+            "last_bytes": stats["last_bytes"],
+            "last_group_size": stats["last_group_size"]
+        }
+    
+    def _change_roots(self, touched_paths: List[str]) -> List[str]:
+        """Reduce touched paths to the outermost ones (a.b makes a.b.c redundant)"""
+        touched = set(touched_paths)
+        roots = []
+        for token_path in sorted(touched):
+            path_parts = token_path.split('.')
+            if not any('.'.join(path_parts[:depth]) in touched for depth in range(1, len(path_parts))):
+                roots.append(token_path)
+        return roots
+    
+    def _record_changes(
+        self,
+        version: int,
+        tokens_hash: str,
+        changes: List[Dict[str, Any]],
+        before: Dict[str, Any],
+        affected: Set[str]
+    ) -> None:
+        """Log the tokens a version changed, with their token types before and after"""
+        token_types = set()
+        for change in changes:
+            for token in (before.get(change["path"]), change["value"]):
+                if token is not None:
+                    token_types.add(token.get("$type"))
+        for token_path in affected:
+            token = self._index.get(token_path)
+            if token is not None:
+                token_types.add(token.get("$type"))
+        
+        self._change_log.append((version, tokens_hash, frozenset(affected), frozenset(token_types)))
+    
+    async def get_changes_since(self, version: int, tokens_hash: str) -> Optional[Dict[str, Any]]:
+        """Get every token changed since the document was at `version` with `tokens_hash`, or None if unknown"""
+        tokens = await self.load_tokens()
+        current = (tokens.get("$metadata") or {}).get("version", 0)
+        
+        if version > current:
+            return None
+        
+        # The log must know the starting state itself; a version number alone can
+        # match a document edited outside the API or loaded after a restart
+        known = [entry[:2] for entry in self._change_log]
+        if self._change_log_base is not None:
+            known.append(self._change_log_base)
+        if (version, tokens_hash) not in known:
+            return None
+        
+        entries = [entry for entry in self._change_log if entry[0] > version]
+        if len(entries) != current - version or (entries and entries[0][0] != version + 1):
+            return None
+        
+        paths = set()
+        token_types = set()
+        for _, _, entry_paths, entry_types in entries:
+            paths.update(entry_paths)
+            token_types.update(entry_types)
+        
+        return {
+            "from_version": version,
+            "to_version": current,
+            "paths": sorted(paths),
+            "token_types": token_types
+        }
+    
+    def _diff_tokens(self, before: Dict[str, Any], after: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Type the differences between two flat {path: token} maps as added/modified/removed"""
+        changes = []
+        
+        for token_path, token in after.items():
+            old_token = before.get(token_path)
+            if old_token is None:
+                change_type = "added"
+            elif old_token is not token and old_token != token:
+                change_type = "modified"
+            else:
+                continue
+            changes.append({"path": token_path, "type": change_type, "value": token})
+            print(f"🔄 Token {change_type}: {token_path} = {token.get('$value')}")
         
-        compare_tokens(old_tokens, new_tokens)
-        return changed_paths, new_values
+        for token_path in before:
+            if token_path not in after:
+                changes.append({"path": token_path, "type": "removed", "value": None})
+                print(f"🔄 Token removed: {token_path}")
+        
+        return changes
+    
+    async def get_resolved_tokens(self) -> Dict[str, Any]:
+        """Get the token document with every reference replaced by its resolved value"""
+        tokens = await self.load_tokens()
+        
+        if self._resolved_document is None:
+            self._resolved_document = self._resolver.resolve_node(tokens)
+        return self._resolved_document
     
-    async def get_token_by_path(self, token_path: str) -> Any:
+    async def get_token_by_path(self, token_path: str, resolved: bool = False) -> Any:
         """Get a specific token value using dot notation"""
         tokens = await self.load_tokens()
         
-        # Navigate through the nested structure
+        node = self._index.get(token_path)
+        if node is not None:
+            return self._resolver.resolve_node(node, token_path) if resolved else node
+        
+        # Fall back to walking the tree for values below token nodes (e.g. "$value")
         current = tokens
         path_parts = token_path.split('.')
         
@@ -125,33 +380,82 @@ class TokenManager:
         
         return current
     
-    async def update_token(self, token_path: str, value: Any, token_type: str, description: Optional[str] = None) -> Dict[str, Any]:
-        """Update a specific token value"""
-        # Validate token type
-        if token_type not in settings.VALID_TOKEN_TYPES:
+    async def get_build_tokens(self) -> List[Tuple[List[str], Dict[str, Any], Any]]:
+        """Get (path parts, token, resolved value) for every token, in document order"""
+        tokens = await self.load_tokens()
+        build_tokens = []
+        
+        def walk(node: Dict[str, Any], path_parts: List[str]) -> None:
+            for key, child in node.items():
+                if key.startswith("$") or not isinstance(child, dict):
+                    continue
+                child_parts = path_parts + [key]
+                if "$value" in child:
+                    build_tokens.append((child_parts, child, self._resolver.resolve('.'.join(child_parts))))
+                else:
+                    walk(child, child_parts)
+        
+        walk(tokens, [])
+        return build_tokens
+    
+    async def get_token_dependents(self, token_path: str) -> Dict[str, Any]:
+        """Get the tokens that reference a token (or any token in a group), from the reverse index"""
+        await self.load_tokens()
+        
+        targets = set(self._index.tokens_under(token_path))
+        if not targets and token_path not in self._resolver.dependents:
             raise HTTPException(
-                status_code=400,
-                detail=f"Invalid token type '{token_type}'. Valid types: {settings.VALID_TOKEN_TYPES}"
+                status_code=404,
+                detail=f"Token not found at path: {token_path}"
             )
+        targets.add(token_path)
         
-        tokens = await self.load_tokens()
+        direct = set()
+        for target in targets:
+            direct.update(self._resolver.dependents.get(target, ()))
+        transitive = self._resolver.transitive_dependents(targets)
         
-        # Navigate to the parent object, creating path if needed
-        path_parts = token_path.split('.')
-        current = tokens
+        return {
+            "token_path": token_path,
+            "references": sorted(self._resolver.dependencies.get(token_path, ())),
+            "direct_dependents": sorted(direct),
+            "transitive_dependents": sorted(transitive),
+            "count": len(transitive)
+        }
+    
+    async def list_tokens(self, prefix: str = "", resolved: bool = False) -> Dict[str, Any]:
+        """Get every token at or below a path as a flat {dot.path: token} mapping"""
+        await self.load_tokens()
         
-        for part in path_parts[:-1]:
-            if part not in current:
-                current[part] = {}
-            elif not isinstance(current[part], dict):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Cannot create token at path '{token_path}': '{part}' is not an object"
-                )
-            current = current[part]
+        if prefix and self._index.get(prefix) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Token not found at path: {prefix}"
+            )
         
-        # Update the final token
-        final_key = path_parts[-1]
+        tokens = self._index.tokens_under(prefix)
+        if resolved:
+            return {
+                token_path: self._resolver.resolve_token(token, token_path)
+                for token_path, token in tokens.items()
+            }
+        return tokens
+    
+    async def update_token(
+        self,
+        token_path: str,
+        value: Any,
+        token_type: str,
+        description: Optional[str] = None,
+        expected_version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Update a specific token value, optionally only if unchanged since `expected_version`"""
+        # Validate token type
+        if token_type not in settings.VALID_TOKEN_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid token type '{token_type}'. Valid types: {settings.VALID_TOKEN_TYPES}"
+            )
         
         # Create DTCG-compliant token structure
         token_obj = {
@@ -162,23 +466,274 @@ class TokenManager:
         if description:
             token_obj["$description"] = description
         
-        current[final_key] = token_obj
+        def apply_update(tokens: FrozenDict) -> Tuple[FrozenDict, List[str], Any]:
+            self._check_precondition(token_path, expected_version)
+            return self._apply_update(tokens, token_path, token_obj)
         
         # Save the updated tokens (this will trigger broadcasts to all clients)
-        await self.save_tokens(tokens)
+        _, version = await self._mutate(apply_update)
         
         print(f"✅ Token updated: {token_path} = {value}")
         
         return {
             "token_path": token_path,
             "updated_value": token_obj,
+            "version": version,
             "timestamp": datetime.now().isoformat()
         }
     
-    async def delete_token(self, token_path: str) -> Dict[str, Any]:
-        """Delete a specific token"""
-        tokens = await self.load_tokens()
+    async def batch_update_tokens(
+        self,
+        updates: List[Dict[str, Any]],
+        expected_version: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Apply several token updates as a single all-or-nothing commit, reporting every failure"""
+        token_objs = []
+        for update in updates:
+            token_obj = {
+                "$value": update["value"],
+                "$type": update["type"]
+            }
+            if update.get("description"):
+                token_obj["$description"] = update["description"]
+            token_objs.append(token_obj)
+        
+        def apply_batch(tokens: FrozenDict) -> Tuple[FrozenDict, List[str], Any]:
+            touched_paths = []
+            errors = []
+            
+            for index, (update, token_obj) in enumerate(zip(updates, token_objs)):
+                token_path = update["token_path"]
+                item_version = update.get("expected_version")
+                try:
+                    self._check_precondition(
+                        token_path,
+                        item_version if item_version is not None else expected_version
+                    )
+                    if token_obj["$type"] not in settings.VALID_TOKEN_TYPES:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Invalid token type '{token_obj['$type']}'. Valid types: {settings.VALID_TOKEN_TYPES}"
+                        )
+                    tokens, paths, _ = self._apply_update(tokens, token_path, token_obj)
+                except HTTPException as e:
+                    errors.append({
+                        "index": index,
+                        "token_path": token_path,
+                        "status_code": e.status_code,
+                        "error": e.detail
+                    })
+                    continue
+                touched_paths.extend(paths)
+            
+            if errors:
+                conflict = all(error["status_code"] == 409 for error in errors)
+                raise HTTPException(
+                    status_code=409 if conflict else 400,
+                    detail={
+                        "message": f"Batch rejected: {len(errors)} of {len(updates)} updates are invalid",
+                        "errors": errors
+                    }
+                )
+            
+            return tokens, touched_paths, None
+        
+        _, version = await self._mutate(apply_batch)
+        
+        print(f"✅ Batch applied: {len(updates)} tokens updated")
+        
+        timestamp = datetime.now().isoformat()
+        return [
+            {
+                "token_path": update["token_path"],
+                "updated_value": token_obj,
+                "version": version,
+                "timestamp": timestamp
+            }
+            for update, token_obj in zip(updates, token_objs)
+        ]
+    
+    async def delete_token(self, token_path: str, expected_version: Optional[int] = None) -> Dict[str, Any]:
+        """Delete a specific token, optionally only if unchanged since `expected_version`"""
+        def apply_delete(tokens: FrozenDict) -> Tuple[FrozenDict, List[str], Any]:
+            self._check_precondition(token_path, expected_version)
+            return self._apply_delete(tokens, token_path)
+        
+        deleted_token, version = await self._mutate(apply_delete)
+        
+        print(f"🗑️  Token deleted: {token_path}")
+        
+        return {
+            "token_path": token_path,
+            "deleted_value": deleted_token,
+            "version": version,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def _mutate(self, mutation: Mutation) -> Tuple[Any, int]:
+        """Queue a mutation for the next group commit; returns its result and version once durable"""
+        await self.load_tokens()
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((mutation, future))
+        if len(self._pending) >= settings.TOKEN_COMMIT_MAX_BATCH:
+            self._batch_ready.set()
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        
+        return await future
+    
+    async def _flush_pending(self) -> None:
+        """Commit queued mutations in groups until the queue is empty"""
+        window = settings.TOKEN_COMMIT_WINDOW_MS / 1000
+        max_batch = settings.TOKEN_COMMIT_MAX_BATCH
+        
+        while self._pending:
+            # Give concurrent writers a short window to join this commit
+            if len(self._pending) < max_batch:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=window)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            
+            async with self._write_lock:
+                batch = self._pending[:max_batch]
+                del self._pending[:max_batch]
+                await self._commit_batch(batch)
+    
+    async def _commit_batch(self, batch: List[Tuple[Mutation, asyncio.Future]]) -> None:
+        """Apply a group of mutations in order and commit them as one version"""
+        try:
+            await self._apply_batch(batch)
+        except Exception as e:
+            # Never leave a caller waiting on a commit that died
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._pending_references = None
+    
+    async def _apply_batch(self, batch: List[Tuple[Mutation, asyncio.Future]]) -> None:
+        tokens = self._refresh_document() or self._document
+        touched_paths: List[str] = []
+        applied: List[Tuple[asyncio.Future, Any]] = []
+        
+        version = (tokens.get("$metadata") or {}).get("version", 0) + 1
+        
+        # References written by earlier mutations of this commit, for cycle checks
+        self._pending_references = ChainMap()
+        
+        for mutation, future in batch:
+            if future.done():
+                continue  # Caller went away before its mutation was applied
+            self._pending_references = self._pending_references.new_child()
+            try:
+                tokens, paths, result = mutation(tokens)
+            except Exception as e:
+                # A failed mutation leaves the document untouched for the rest of the group
+                self._pending_references = self._pending_references.parents
+                future.set_exception(e)
+                continue
+            mutation_references = self._pending_references.maps[0]
+            self._pending_references = self._pending_references.parents
+            self._pending_references.update(mutation_references)
+            # Record revisions right away so later mutations in this group see the
+            # change. If the write fails they stay ahead, which can only cause a
+            # spurious conflict, never a lost update.
+            self._record_revisions(paths, version)
+            touched_paths.extend(paths)
+            applied.append((future, result))
+        
+        if not applied:
+            return
+        
+        try:
+            await self._commit(tokens, touched_paths)
+        except Exception as e:
+            for future, _ in applied:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        self.write_stats["last_group_size"] = len(applied)
+        for future, result in applied:
+            if not future.done():
+                future.set_result((result, version))
+    
+    def get_revision(self, token_path: str) -> int:
+        """Get the document version in which a path, or anything above or below it, last changed"""
+        revision = self._subtree_revisions.get(token_path, self._base_revision)
+        
+        path_parts = token_path.split('.')
+        for depth in range(1, len(path_parts)):
+            ancestor = '.'.join(path_parts[:depth])
+            revision = max(revision, self._node_revisions.get(ancestor, self._base_revision))
         
+        return revision
+    
+    def _check_precondition(self, token_path: str, expected_version: Optional[int]) -> None:
+        """Raise 409 if a path changed after the version the client last saw"""
+        if expected_version is None:
+            return
+        
+        revision = self.get_revision(token_path)
+        if revision > expected_version:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": f"Token at path '{token_path}' changed since version {expected_version}",
+                    "token_path": token_path,
+                    "expected_version": expected_version,
+                    "current_revision": revision
+                }
+            )
+    
+    def _record_revisions(self, touched_paths: List[str], version: int) -> None:
+        """Mark paths (and their ancestors' subtrees) as changed in `version`"""
+        for token_path in touched_paths:
+            self._node_revisions[token_path] = version
+            path_parts = token_path.split('.')
+            for depth in range(1, len(path_parts) + 1):
+                self._subtree_revisions['.'.join(path_parts[:depth])] = version
+    
+    def _reset_revisions(self, tokens: Dict[str, Any]) -> None:
+        """Treat every path as last changed at the document's current version"""
+        self._base_revision = (tokens.get("$metadata") or {}).get("version", 0)
+        self._subtree_revisions.clear()
+        self._node_revisions.clear()
+    
+    def _apply_update(self, tokens: FrozenDict, token_path: str, token_obj: Dict[str, Any]) -> Tuple[FrozenDict, List[str], Any]:
+        """Store a token in a document, creating missing groups along the way"""
+        # Check the parent path; missing groups are created by replace_path
+        path_parts = token_path.split('.')
+        current = tokens
+        
+        for part in path_parts[:-1]:
+            if part not in current:
+                break
+            elif not isinstance(current[part], dict):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Cannot create token at path '{token_path}': '{part}' is not an object"
+                )
+            current = current[part]
+        
+        cycle = self._resolver.creates_cycle(token_path, token_obj["$value"], self._pending_references)
+        if cycle:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Circular token reference: {' -> '.join(cycle)}"
+            )
+        
+        if self._pending_references is not None:
+            self._pending_references[token_path] = find_references(token_obj["$value"])
+        
+        return replace_path(tokens, path_parts, token_obj), [token_path], token_obj
+    
+    def _apply_delete(self, tokens: FrozenDict, token_path: str) -> Tuple[FrozenDict, List[str], Any]:
+        """Remove a token or group from a document"""
         # Navigate to the parent object
         path_parts = token_path.split('.')
         current = tokens
@@ -199,33 +754,79 @@ class TokenManager:
                 detail=f"Token not found at path: {token_path}"
             )
         
-        deleted_token = current.pop(final_key)
+        removed = current[final_key]
+        if self._pending_references is not None:
+            # Removed tokens no longer reference anything
+            stack = [(token_path, removed)]
+            while stack:
+                node_path, node = stack.pop()
+                if not isinstance(node, dict):
+                    continue
+                if "$value" in node:
+                    self._pending_references[node_path] = set()
+                stack.extend((f"{node_path}.{key}", child) for key, child in node.items() if not key.startswith("$"))
         
-        # Save the updated tokens
-        await self.save_tokens(tokens)
+        return replace_path(tokens, path_parts), [token_path], removed
+    
+    async def get_tokens_hash(self) -> str:
+        """Get the content hash of the current token document (build cache key input)"""
+        tokens = await self.load_tokens()
+        return document_hash(tokens)
+    
+    async def get_document_state(self) -> Tuple[int, str]:
+        """Get the version and content hash of the current token document together"""
+        tokens = await self.load_tokens()
+        return (tokens.get("$metadata") or {}).get("version", 0), document_hash(tokens)
+    
+    def _calculate_tokens_hash(self, tokens: Dict[str, Any]) -> str:
+        """Calculate a Merkle hash of the tokens for change detection"""
+        # Unchanged subtrees keep their cached hashes, so only edited ancestors are rehashed
+        return document_hash(tokens)
+    
+    async def get_subtree_hashes(self, token_path: str = "", depth: int = 1) -> Dict[str, Any]:
+        """Get the Merkle hash of a group and of its descendants down to `depth` levels"""
+        tokens = await self.load_tokens()
         
-        print(f"🗑️  Token deleted: {token_path}")
+        if token_path:
+            node = self._index.get(token_path)
+            if node is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Token not found at path: {token_path}"
+                )
+            root_hash = node_hash(node)
+        else:
+            node = tokens
+            root_hash = document_hash(tokens)
+        
+        hashes: Dict[str, str] = {}
+        
+        def collect(current: Dict[str, Any], prefix: str, remaining: int) -> None:
+            if remaining <= 0 or "$value" in current:
+                return
+            for key, child in current.items():
+                if key.startswith("$") or not isinstance(child, dict):
+                    continue
+                path = f"{prefix}.{key}" if prefix else key
+                hashes[path] = node_hash(child)
+                collect(child, path, remaining - 1)
+        
+        collect(node, token_path, depth)
         
         return {
-            "token_path": token_path,
-            "deleted_value": deleted_token,
-            "timestamp": datetime.now().isoformat()
+            "path": token_path,
+            "hash": root_hash,
+            "version": tokens.get("$metadata", {}).get("version", 0),
+            "hashes": hashes
         }
     
-    def _calculate_tokens_hash(self, tokens: Dict[str, Any]) -> str:
-        """Calculate a hash of the tokens for change detection"""
-        # Create a copy without metadata for consistent hashing
-        tokens_copy = {k: v for k, v in tokens.items() if not k.startswith("$")}
-        tokens_str = json.dumps(tokens_copy, sort_keys=True)
-        return hashlib.md5(tokens_str.encode()).hexdigest()
-    
     def get_token_metadata(self) -> Dict[str, Any]:
         """Get token metadata including version and hash"""
         try:
-            tokens = asyncio.run(self.load_tokens())
-            return tokens.get("$metadata", {})
+            tokens = self._refresh_document()
         except Exception:
             return {}
+        return dict(tokens.get("$metadata", {})) if tokens else {}
     
     def _create_default_tokens(self) -> Dict[str, Any]:
         """Create a minimal default token set"""
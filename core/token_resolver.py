@@ -0,0 +1,198 @@
+# Token reference resolution ({color.primitive.blue.500} aliases)
+
+import re
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set
+
+from core.token_document import FrozenDict
+from core.token_index import TokenIndex
+
+REFERENCE_PATTERN = re.compile(r"\{([^{}]+)\}")
+
+class CircularReferenceError(Exception):
+    """Raised while resolving when a token (indirectly) references itself"""
+
+def find_references(value: Any) -> Set[str]:
+    """Get every token path referenced from a $value (strings, lists and composite values)"""
+    if isinstance(value, str):
+        return set(REFERENCE_PATTERN.findall(value))
+    if isinstance(value, (list, tuple)):
+        return set().union(*(find_references(item) for item in value)) if value else set()
+    if isinstance(value, dict):
+        return set().union(*(find_references(item) for item in value.values())) if value else set()
+    return set()
+
+class TokenResolver:
+    """Resolves token references over a TokenIndex, memoizing resolved values"""
+
+    def __init__(self, index: TokenIndex):
+        self.index = index
+        # The reference graph in both directions, so an edit invalidates only its dependents
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.dependents: Dict[str, Set[str]] = {}
+        # Tokens in a reference cycle resolve to their raw value
+        self.cycles: Set[str] = set()
+        self._resolved: Dict[str, Any] = {}
+
+    def rebuild(self) -> None:
+        """Rebuild the reference graph for every indexed token"""
+        self.dependencies = {}
+        self.dependents = {}
+        self.cycles = set()
+        self._resolved = {}
+
+        for token_path, token in self.index.tokens_under().items():
+            self._link(token_path, find_references(token["$value"]))
+
+    def update(self, changed_paths: Iterable[str]) -> Set[str]:
+        """Refresh the graph for changed (or removed) tokens; returns them plus their dependents"""
+        changed_paths = list(changed_paths)
+        for token_path in changed_paths:
+            self._unlink(token_path)
+            token = self.index.get(token_path)
+            if token is not None and "$value" in token:
+                self._link(token_path, find_references(token["$value"]))
+
+        affected = self.transitive_dependents(changed_paths)
+        affected.update(changed_paths)
+        for token_path in affected:
+            self._resolved.pop(token_path, None)
+            self.cycles.discard(token_path)
+
+        return affected
+
+    def transitive_dependents(self, token_paths: Iterable[str]) -> Set[str]:
+        """Get every token that references any of the paths, directly or indirectly"""
+        seen: Set[str] = set()
+        stack = list(token_paths)
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+        return seen
+
+    def creates_cycle(
+        self,
+        token_path: str,
+        value: Any,
+        pending: Optional[Mapping[str, Set[str]]] = None
+    ) -> Optional[List[str]]:
+        """Check whether giving `token_path` this $value would close a reference cycle"""
+        # pending holds references written earlier in the same commit; removed tokens map to set()
+        for reference in find_references(value):
+            chain = self._path_to(reference, token_path, set(), pending or {})
+            if chain is not None:
+                return [token_path] + chain
+        return None
+
+    def resolve(self, token_path: str) -> Any:
+        """Get the fully resolved $value of a token"""
+        if token_path in self._resolved:
+            return self._resolved[token_path]
+        return self._resolve(token_path, [])
+
+    def resolve_token(self, token: Dict[str, Any], token_path: str) -> Dict[str, Any]:
+        """Get a copy of a token with its $value resolved"""
+        resolved = dict(token)
+        resolved["$value"] = self.resolve(token_path)
+        return FrozenDict(resolved)
+
+    def resolve_node(self, node: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+        """Get a copy of a token or group with every $value below it resolved"""
+        if "$value" in node and prefix:
+            return self.resolve_token(node, prefix)
+
+        items = {}
+        for key, child in node.items():
+            if key.startswith("$") or not isinstance(child, dict):
+                items[key] = child
+            else:
+                items[key] = self.resolve_node(child, f"{prefix}.{key}" if prefix else key)
+        return FrozenDict(items)
+
+    def _resolve(self, token_path: str, visiting: List[str]) -> Any:
+        if token_path in self._resolved:
+            return self._resolved[token_path]
+
+        token = self.index.get(token_path)
+        if token is None or "$value" not in token:
+            raise KeyError(token_path)
+
+        if token_path in visiting:
+            cycle = visiting[visiting.index(token_path):]
+            self.cycles.update(cycle)
+            raise CircularReferenceError(" -> ".join(cycle + [token_path]))
+
+        visiting.append(token_path)
+        try:
+            value = self._resolve_value(token["$value"], visiting)
+        except CircularReferenceError:
+            # Only raised into the innermost token of a cycle; callers outside it resolve normally
+            value = token["$value"]
+        finally:
+            visiting.pop()
+
+        # Leave tokens on a cycle unresolved instead of failing the whole view
+        if token_path in self.cycles:
+            value = token["$value"]
+
+        self._resolved[token_path] = value
+        return value
+
+    def _resolve_value(self, value: Any, visiting: List[str]) -> Any:
+        if isinstance(value, str):
+            match = REFERENCE_PATTERN.fullmatch(value)
+            if match:
+                # A pure alias takes the referenced value as-is, whatever its type
+                try:
+                    return self._resolve(match.group(1), visiting)
+                except KeyError:
+                    return value
+
+            def substitute(reference: re.Match) -> str:
+                try:
+                    return str(self._resolve(reference.group(1), visiting))
+                except KeyError:
+                    return reference.group(0)
+
+            return REFERENCE_PATTERN.sub(substitute, value)
+
+        if isinstance(value, (list, tuple)):
+            return tuple(self._resolve_value(item, visiting) for item in value)
+        if isinstance(value, dict):
+            return FrozenDict((key, self._resolve_value(item, visiting)) for key, item in value.items())
+        return value
+
+    def _path_to(
+        self,
+        start: str,
+        target: str,
+        seen: Set[str],
+        pending: Mapping[str, Set[str]]
+    ) -> Optional[List[str]]:
+        if start == target:
+            return [target]
+        if start in seen:
+            return None
+        seen.add(start)
+        references = pending[start] if start in pending else self.dependencies.get(start, ())
+        for reference in references:
+            chain = self._path_to(reference, target, seen, pending)
+            if chain is not None:
+                return [start] + chain
+        return None
+
+    def _link(self, token_path: str, references: Set[str]) -> None:
+        if not references:
+            return
+        self.dependencies[token_path] = references
+        for reference in references:
+            self.dependents.setdefault(reference, set()).add(token_path)
+
+    def _unlink(self, token_path: str) -> None:
+        for reference in self.dependencies.pop(token_path, ()):
+            dependents = self.dependents.get(reference)
+            if dependents is not None:
+                dependents.discard(token_path)
+                if not dependents:
+                    del self.dependents[reference]
@@ -1,34 +1,135 @@
+import asyncio
+import json
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Any, Set
-from fastapi import Request
+from typing import Dict, List, Any, Set, NamedTuple, Optional, Tuple
+from sse_starlette import ServerSentEvent
+
+from core.config import settings
+from core.update_history import UpdateHistory, fold_updates
+from core.update_journal import UpdateJournal
+
+# SSE event name for each broadcast update type
+EVENT_NAMES = {
+    "TOKEN_UPDATE": "token-update",
+    "BUILD_COMPLETE": "build-complete",
+    "RESYNC_REQUIRED": "resync-required"
+}
+
+class BroadcastEvent(NamedTuple):
+    """A broadcast update, encoded once into an SSE frame that every client shares"""
+    type: str
+    version: int
+    frame: bytes
+
+def encode_event(update_data: Dict[str, Any], event_id: Optional[int] = None) -> BroadcastEvent:
+    """Serialize an update into a ready-to-send SSE frame"""
+    frame = ServerSentEvent(
+        data=json.dumps(update_data),
+        event=EVENT_NAMES[update_data["type"]],
+        id=str(event_id) if event_id is not None else None
+    ).encode()
+    return BroadcastEvent(update_data["type"], update_data.get("version", 0), frame)
 
 class UpdateBroadcaster:
     """Broadcasting system for token updates via Server-Sent Events"""
     
     def __init__(self):
-        # SSE connections - store as Request objects
-        self.sse_connections: Set[Request] = set()
-        
-        # Track update history for clients that reconnect
-        self.update_history: List[Dict[str, Any]] = []
-        self.max_history_size = 100
+        # One bounded queue per SSE client; every broadcast is pushed to all of them
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.resyncs = 0
         
         # Current version/hash for quick comparison
         self.current_version = 1
         self.current_hash = None
+        
+        # Track update history for clients that reconnect
+        self.history = UpdateHistory(settings.UPDATE_HISTORY_SIZE)
+        self.history.reset(self.current_version)
+        
+        # Net deltas of recent catch-up ranges; a version range never changes once written
+        self._deltas: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+        self.delta_hits = 0
+        self.delta_misses = 0
+        
+        # Opened by restore() at startup
+        self.journal: Optional[UpdateJournal] = None
+    
+    async def restore(self, tokens_hash: str):
+        """Resume the version and update history from the journal; called once at startup"""
+        if settings.UPDATE_JOURNAL_ENABLED:
+            self.journal = UpdateJournal(
+                settings.UPDATE_JOURNAL_DIR or settings.TOKENS_DIR / ".journal",
+                settings.UPDATE_JOURNAL_SEGMENT_BYTES,
+                settings.UPDATE_JOURNAL_FSYNC
+            )
+            records = await asyncio.to_thread(self.journal.replay)
+            for record in records:
+                if record["type"] == "RESET":
+                    self.history.reset(record["version"], record["hash"])
+                else:
+                    self.history.append(record)
+                self.current_version = record["version"]
+                self.current_hash = record["hash"]
+            
+            if records:
+                print(f"📜 Replayed {len(records)} journaled updates (v{self.current_version})")
+        
+        # Tokens edited while the server was down: the journal no longer leads to them,
+        # so versions move on and clients from before the restart reload in full
+        if self.current_hash != tokens_hash:
+            if self.current_hash is not None:
+                self.current_version += 1
+            self.current_hash = tokens_hash
+            self.history.reset(self.current_version, tokens_hash)
+            await self._journal({
+                "type": "RESET",
+                "version": self.current_version,
+                "hash": tokens_hash,
+                "timestamp": datetime.now().isoformat()
+            })
     
-    def add_sse_connection(self, request: Request):
-        """Add an SSE connection"""
-        self.sse_connections.add(request)
-        print(f"📡 SSE client connected. Total: {len(self.sse_connections)}")
+    def close(self):
+        """Close the journal"""
+        if self.journal is not None:
+            self.journal.close()
+    
+    async def _journal(self, record: Dict[str, Any]):
+        """Append a record to the journal, compacting it when a segment fills up"""
+        if self.journal is None:
+            return
+        
+        try:
+            if await asyncio.to_thread(self.journal.append, record):
+                # Keep the base update too: it carries the hash of the oldest position
+                await asyncio.to_thread(self.journal.compact, self.history.base_version - 1)
+        except OSError as e:
+            # The update is already saved; only catch-up after a restart is affected
+            print(f"❌ Failed to journal update v{record['version']}: {e}")
     
-    def remove_sse_connection(self, request: Request):
-        """Remove an SSE connection"""
-        self.sse_connections.discard(request)
-        print(f"📡 SSE client disconnected. Total: {len(self.sse_connections)}")
+    def subscribe(self) -> asyncio.Queue:
+        """Register an SSE client and get the queue its updates are pushed to"""
+        queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        print(f"📡 SSE client connected. Total: {len(self.subscribers)}")
+        return queue
     
-    async def broadcast_token_update(self, changed_paths: List[str], new_values: Dict[str, Any], tokens_hash: str):
-        """Broadcast token updates via SSE"""
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Remove an SSE client"""
+        self.subscribers.discard(queue)
+        print(f"📡 SSE client disconnected. Total: {len(self.subscribers)}")
+    
+    async def broadcast_token_update(
+        self,
+        changed_paths: List[str],
+        new_values: Dict[str, Any],
+        tokens_hash: str,
+        changes: Optional[List[Dict[str, Any]]] = None,
+        dependent_paths: Optional[List[str]] = None,
+        resolved_values: Optional[Dict[str, Any]] = None
+    ):
+        """Broadcast token updates via SSE as a typed delta, with affected dependents"""
+        # changes: (path, added/modified/removed); resolved_values covers changed and dependent tokens
         self.current_version += 1
         self.current_hash = tokens_hash
         
@@ -38,85 +139,119 @@ class UpdateBroadcaster:
             "hash": tokens_hash,
             "data": {
                 "changed_paths": changed_paths,
-                "new_values": new_values
+                "new_values": new_values,
+                "changes": changes or [],
+                "dependent_paths": dependent_paths or [],
+                "resolved_values": resolved_values or {}
             },
             "timestamp": datetime.now().isoformat()
         }
         
-        # Add to history for reconnecting clients
-        self._add_to_history(update_data)
+        # Add to history for reconnecting clients, durably before anyone sees it
+        self.history.append(update_data)
+        await self._journal(update_data)
         
         # Broadcast to SSE clients
-        await self._broadcast_sse(update_data)
+        self._broadcast_sse(encode_event(update_data, self.current_version))
         
-        print(f"📡 Update broadcasted to {len(self.sse_connections)} SSE clients")
+        print(f"📡 Update broadcasted to {len(self.subscribers)} SSE clients")
         print(f"   Changed paths: {changed_paths}")
     
-    async def _broadcast_sse(self, update_data: Dict[str, Any]):
-        """Send update to all SSE connections"""
-        if not self.sse_connections:
-            print("📡 No SSE clients to notify")
-            return
+    async def broadcast_build_complete(self, build_data: Dict[str, Any]):
+        """Broadcast a finished background build via SSE"""
+        # Not a token update: no version bump, and it stays out of the catch-up history
+        update_data = {
+            "type": "BUILD_COMPLETE",
+            "artifact_version": build_data["artifact_version"],
+            "hash": build_data["hash"],
+            "data": build_data,
+            "timestamp": datetime.now().isoformat()
+        }
         
-        # Store the message to be sent by SSE generators
-        self._latest_update = update_data
+        # The id stays the token version so reconnecting clients resume from it
+        self._broadcast_sse(encode_event(update_data, self.current_version))
         
-        # Note: Actual SSE message sending happens in the SSE endpoint generator
-        # This method just stores the update and marks connections for cleanup
+        print(f"📡 Build v{build_data['artifact_version']} broadcasted to {len(self.subscribers)} SSE clients")
+    
+    def _broadcast_sse(self, event: BroadcastEvent):
+        """Push an encoded update to every SSE client's queue without waiting on any of them"""
+        if not self.subscribers:
+            print("📡 No SSE clients to notify")
+            return
         
-        # Check for disconnected clients
-        disconnected = []
-        for request in self.sse_connections.copy():
+        resync = None
+        for queue in self.subscribers:
             try:
-                if await request.is_disconnected():
-                    disconnected.append(request)
-            except Exception:
-                disconnected.append(request)
-        
-        # Clean up disconnected clients
-        for request in disconnected:
-            self.remove_sse_connection(request)
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The client can't keep up; replace its backlog with a single resync
+                # notice rather than blocking the broadcast or growing without bound
+                while not queue.empty():
+                    queue.get_nowait()
+                if resync is None:
+                    resync = self._resync_event()
+                queue.put_nowait(resync)
+                self.resyncs += 1
     
-    def get_latest_update(self):
-        """Get the latest update for SSE generators"""
-        return getattr(self, '_latest_update', None)
+    def _resync_event(self) -> BroadcastEvent:
+        # No event id: the client has not seen the updates up to the current version
+        return encode_event({
+            "type": "RESYNC_REQUIRED",
+            "version": self.current_version,
+            "hash": self.current_hash,
+            "message": "Too many updates were missed; reload the tokens",
+            "timestamp": datetime.now().isoformat()
+        })
     
-    def clear_latest_update(self):
-        """Clear the latest update after it's been sent"""
-        if hasattr(self, '_latest_update'):
-            delattr(self, '_latest_update')
+    def get_updates_since_version(self, since_version: int) -> Optional[List[Dict[str, Any]]]:
+        """Get all updates since a specific version, or None if a full reload is needed"""
+        return self.history.since_version(since_version)
     
-    def _add_to_history(self, update_data: Dict[str, Any]):
-        """Add update to history for reconnecting clients"""
-        self.update_history.append(update_data)
+    def get_net_delta_since_version(self, since_version: int) -> Optional[List[Dict[str, Any]]]:
+        """Get the updates since a version folded into a list of at most one net delta, or None"""
+        if not self.history.covers(since_version):
+            return None
+        if self.history.last_version - since_version <= 1:
+            return self.history.since_version(since_version)
         
-        # Trim history if too large
-        if len(self.update_history) > self.max_history_size:
-            self.update_history = self.update_history[-self.max_history_size:]
-    
-    def get_updates_since_version(self, since_version: int) -> List[Dict[str, Any]]:
-        """Get all updates since a specific version"""
-        return [
-            update for update in self.update_history 
-            if update.get("version", 0) > since_version
-        ]
+        key = (since_version, self.history.last_version)
+        delta = self._deltas.get(key)
+        if delta is not None:
+            self._deltas.move_to_end(key)
+            self.delta_hits += 1
+            return [delta]
+        
+        delta = fold_updates(self.history.since_version(since_version))
+        self._deltas[key] = delta
+        if len(self._deltas) > settings.UPDATE_DELTA_CACHE_SIZE:
+            self._deltas.popitem(last=False)
+        self.delta_misses += 1
+        return [delta]
     
-    def get_updates_since_hash(self, client_hash: str) -> List[Dict[str, Any]]:
-        """Get updates since a specific hash (if client is out of sync)"""
+    def get_updates_since_hash(self, client_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """Get exactly the updates a client holding tokens with this hash missed, or None if a full reload is needed"""
         if client_hash == self.current_hash:
             return []  # Client is up to date
         
-        # If hash doesn't match, return recent updates
-        return self.update_history[-10:] if self.update_history else []
+        return self.history.since_hash(client_hash)
     
     def get_current_status(self) -> Dict[str, Any]:
         """Get current broadcasting status"""
+        latest = self.history.latest()
         return {
             "current_version": self.current_version,
             "current_hash": self.current_hash,
-            "sse_clients": len(self.sse_connections),
-            "update_history_size": len(self.update_history),
-            "last_update": self.update_history[-1]["timestamp"] if self.update_history else None
+            "sse_clients": len(self.subscribers),
+            "sse_resyncs": self.resyncs,
+            "update_history_size": len(self.history),
+            "update_history_capacity": self.history.capacity,
+            "oldest_catch_up_version": self.history.base_version,
+            "delta_cache": {
+                "size": len(self._deltas),
+                "hits": self.delta_hits,
+                "misses": self.delta_misses
+            },
+            "last_update": latest["timestamp"] if latest else None
         }
 
 # Global broadcaster instance
@@ -0,0 +1,123 @@
+# Version-indexed ring buffer of token updates for reconnecting clients
+
+from typing import Any, Dict, List, Optional
+
+def fold_updates(updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fold consecutive token updates into one TOKEN_UPDATE with their net effect"""
+    # Each path keeps its last write, typed by whether it existed before and after the run;
+    # added then removed drops out entirely
+    existed: Dict[str, bool] = {}
+    last: Dict[str, Dict[str, Any]] = {}
+    dependent_paths = set()
+    resolved_values: Dict[str, Any] = {}
+
+    for update in updates:
+        data = update["data"]
+        for change in data["changes"]:
+            existed.setdefault(change["path"], change["type"] != "added")
+            last[change["path"]] = change
+        dependent_paths.update(data["dependent_paths"])
+        resolved_values.update(data["resolved_values"])
+
+    changes = []
+    for path, change in last.items():
+        exists = change["type"] != "removed"
+        if existed[path] and exists:
+            changes.append({**change, "type": "modified"})
+        elif exists:
+            changes.append({**change, "type": "added"})
+        elif existed[path]:
+            changes.append(change)
+
+    changed_paths = [change["path"] for change in changes]
+    gone = set(last) - {change["path"] for change in changes if change["type"] != "removed"}
+    newest = updates[-1]
+    return {
+        "type": "TOKEN_UPDATE",
+        "version": newest["version"],
+        "from_version": updates[0]["version"] - 1,
+        "update_count": len(updates),
+        "hash": newest["hash"],
+        "data": {
+            "changed_paths": changed_paths,
+            "new_values": {
+                change["path"]: change["value"]
+                for change in changes
+                if change["type"] != "removed"
+            },
+            "changes": changes,
+            "dependent_paths": sorted(dependent_paths - set(last)),
+            "resolved_values": {
+                path: value
+                for path, value in resolved_values.items()
+                if path not in gone
+            }
+        },
+        "timestamp": newest["timestamp"]
+    }
+
+class UpdateHistory:
+    """Fixed-capacity ring buffer of token updates, indexed by version"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        # Versions are consecutive, so update v lives in slot v % capacity
+        self._slots: List[Optional[Dict[str, Any]]] = [None] * self.capacity
+        # Clients from base_version (just before the oldest update) on can catch up exactly
+        self.base_version = 0
+        self.last_version = 0
+        self._base_hash: Optional[str] = None
+        self._versions_by_hash: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.last_version - self.base_version
+
+    def reset(self, version: int, tokens_hash: Optional[str] = None) -> None:
+        """Forget every update; clients at `version` (with `tokens_hash`) are up to date"""
+        self._slots = [None] * self.capacity
+        self.base_version = self.last_version = version
+        self._base_hash = tokens_hash
+        self._versions_by_hash = {tokens_hash: version} if tokens_hash else {}
+
+    def append(self, update: Dict[str, Any]) -> None:
+        """Add the update that follows the newest retained one"""
+        version = update["version"]
+        if version != self.last_version + 1:
+            # Not a continuation; earlier positions can no longer be caught up exactly
+            self.reset(version - 1)
+
+        if len(self) == self.capacity:
+            # The oldest update's predecessor state drops out of reach
+            if self._base_hash and self._versions_by_hash.get(self._base_hash) == self.base_version:
+                del self._versions_by_hash[self._base_hash]
+            self.base_version += 1
+            self._base_hash = self._slots[self.base_version % self.capacity]["hash"]
+
+        self._slots[version % self.capacity] = update
+        self.last_version = version
+        # A hash seen again maps to its newest version, the shortest catch-up
+        self._versions_by_hash[update["hash"]] = version
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Get the newest update, if any"""
+        return self._slots[self.last_version % self.capacity] if len(self) else None
+
+    def covers(self, version: int) -> bool:
+        """Check whether every update after `version` is retained"""
+        # Too old, or ahead of this server (it restarted and lost its history)
+        return self.base_version <= version <= self.last_version
+
+    def since_version(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Get the updates after `version`, or None if they are no longer all retained"""
+        if not self.covers(version):
+            return None
+        return [self._slots[v % self.capacity] for v in range(version + 1, self.last_version + 1)]
+
+    def version_of(self, tokens_hash: str) -> Optional[int]:
+        """Get the newest retained version whose tokens had this hash"""
+        return self._versions_by_hash.get(tokens_hash)
+
+    def since_hash(self, tokens_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the updates after the state with this hash, or None if it is unknown"""
+        version = self.version_of(tokens_hash)
+        return None if version is None else self.since_version(version)
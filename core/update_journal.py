@@ -0,0 +1,77 @@
+# Append-only on-disk journal of token updates, replayed at startup
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, IO, List, Optional
+
+class UpdateJournal:
+    """Durable log of broadcast updates, so versions and client catch-up survive restarts"""
+
+    def __init__(self, directory: Path, segment_bytes: int, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._file: Optional[IO[str]] = None
+
+    def _segments(self) -> List[Path]:
+        # JSON-lines segments named after their first version; zero-padded names sort in order
+        return sorted(self.directory.glob("updates-*.jsonl"))
+
+    @staticmethod
+    def _first_version(segment: Path) -> int:
+        return int(segment.stem.split("-", 1)[1])
+
+    def replay(self) -> List[Dict[str, Any]]:
+        """Read every record in order, skipping a record torn by a crash mid-write"""
+        records = []
+        for segment in self._segments():
+            with open(segment, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"⚠️  Skipping unreadable journal record in {segment.name}")
+        return records
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Durably add a record; returns True if it filled the segment. Runs in a worker thread"""
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            segments = self._segments()
+            if segments and segments[-1].stat().st_size < self.segment_bytes:
+                segment = segments[-1]
+            else:
+                segment = self.directory / f"updates-{record['version']:012d}.jsonl"
+            self._file = open(segment, 'a', encoding='utf-8')
+            # Terminate a record torn by a crash so it doesn't swallow the next one
+            if self._file.tell() and not segment.read_bytes().endswith(b"\n"):
+                self._file.write("\n")
+
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        # Rotate: the next record opens a new segment
+        if self._file.tell() >= self.segment_bytes:
+            self.close()
+            return True
+        return False
+
+    def compact(self, oldest_version: int) -> int:
+        """Delete segments holding only updates up to oldest_version; returns how many"""
+        segments = self._segments()
+        removed = 0
+        # A segment ends where the next begins; the newest one is never deleted
+        for segment, following in zip(segments, segments[1:]):
+            if self._first_version(following) - 1 > oldest_version:
+                break
+            segment.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -7,6 +7,7 @@ from core.config import settings
 from core.update_broadcaster import broadcaster
 from core.token_manager import token_manager
 from core.style_dictionary import style_builder
+from core.build_scheduler import build_scheduler
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -58,6 +59,9 @@ def create_app() -> FastAPI:
         # Load initial tokens
         await token_manager.load_tokens()
         
+        # Continue update versions and history from before the restart
+        await broadcaster.restore(await token_manager.get_tokens_hash())
+        
         # Setup Style Dictionary
         await style_builder.setup_style_dictionary()
         
@@ -67,6 +71,13 @@ def create_app() -> FastAPI:
         print(f"📁 Tokens: {settings.TOKENS_DIR}")
         print(f"🏗️  Builds: {settings.BUILD_DIR}")
 
+    @app.on_event("shutdown")
+    async def shutdown():
+        """Stop background workers"""
+        await build_scheduler.shutdown()
+        await style_builder.shutdown()
+        broadcaster.close()
+
     return app
 
 # Create the app instance
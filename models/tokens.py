@@ -11,6 +11,7 @@ class TokenUpdate(BaseModel):
     value: Union[str, int, float, List[str]] = Field(..., description="Token value")
     type: str = Field(..., description="Token type (color, dimension, etc.)")
     description: Optional[str] = Field(None, description="Optional description")
+    expected_version: Optional[int] = Field(None, description="Reject with 409 if the token changed after this version")
     
     @field_validator('type')
     @classmethod
@@ -62,14 +63,15 @@ class TokenUpdate(BaseModel):
 class TokenBatchUpdate(BaseModel):
     """Model for batch token updates"""
     tokens: List[TokenUpdate] = Field(..., description="List of token updates")
+    expected_version: Optional[int] = Field(None, description="Default precondition version for every update")
     
     @field_validator('tokens')
     @classmethod
     def validate_tokens_not_empty(cls, v):
         if not v:
             raise ValueError('Token list cannot be empty')
-        if len(v) > 100:  # Reasonable limit for batch operations
-            raise ValueError('Cannot update more than 100 tokens at once')
+        if len(v) > settings.MAX_BATCH_SIZE:
+            raise ValueError(f'Cannot update more than {settings.MAX_BATCH_SIZE} tokens at once')
         return v
 
 class TokenMetadata(BaseModel):
@@ -92,21 +94,6 @@ class TokenCollection(BaseModel):
     class Config:
         validate_by_name = True
 
-class BuildRequest(BaseModel):
-    """Model for build requests"""
-    platforms: Optional[List[str]] = Field(None, description="Platforms to build")
-    force_rebuild: bool = Field(False, description="Force rebuild even if no changes")
-    
-    @field_validator('platforms')
-    @classmethod
-    def validate_platforms(cls, v):
-        if v is not None:
-            available = settings.PLATFORMS + ['scss', 'json']
-            invalid = [p for p in v if p not in available]
-            if invalid:
-                raise ValueError(f'Invalid platforms: {invalid}. Available: {available}')
-        return v
-
 class PlatformFile(BaseModel):
     """Model for platform file information"""
     name: str = Field(..., description="File name")
@@ -139,6 +126,9 @@ class UpdateNotification(BaseModel):
     hash: Optional[str] = Field(None, description="Token hash")
     changed_paths: List[str] = Field(default_factory=list, description="Changed token paths")
     new_values: Dict[str, Any] = Field(default_factory=dict, description="New token values")
+    changes: List[Dict[str, Any]] = Field(default_factory=list, description="Typed changes (added, modified, removed) per path")
+    dependent_paths: List[str] = Field(default_factory=list, description="Tokens referencing a changed token")
+    resolved_values: Dict[str, Any] = Field(default_factory=dict, description="Resolved values of changed and dependent tokens")
     timestamp: str = Field(..., description="Update timestamp")
 
 class SyncRequest(BaseModel):